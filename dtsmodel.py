@@ -0,0 +1,498 @@
+import hashlib
+import os
+import re
+from array import array
+
+from PyQt6 import QtCore, QtGui
+from PyQt6.QtCore import Qt, QModelIndex
+from PyQt6.QtGui import QColor
+
+DELETED_TAG = "__[|>*DELETED*<|]__"
+
+# Source position of annotated line "file:line:col-line:col" and position without range "file:line"
+SOURCE_RE = re.compile(r'(.*):(\d+):(\d+)-(\d+):(\d+)$')
+SOURCE_LINE_RE = re.compile(r'(.*):(\d+)$')
+
+
+class DTSNode(object):
+
+    __slots__ = ('path', 'depth', 'startLine', 'endLine', 'row')
+
+    def __init__(self, path, depth, startLine, row):
+        self.path = path
+        self.depth = depth
+        self.startLine = startLine
+        # Line of closing bracket, None while the node is open
+        self.endLine = None
+        # Row of the line with opening bracket
+        self.row = row
+
+
+class DTSLineTable(object):
+
+    # Row flags
+    FLAG_DELETED = 0x01
+    FLAG_NO_SOURCE = 0x02
+
+    def __init__(self):
+        # One entry per row in the columns below
+        self.lineNums = array('I')
+        self.contents = []
+        self.fileIds = array('i')
+        self.sourceIds = array('i')
+        self.chainIds = array('i')
+        self.flags = array('B')
+
+        # Node hierarchy, rows between brackets of a node are its children,
+        # parent of top-level rows is -1
+        self.parentRows = array('i')
+        self.childPos = array('I')
+        self.children = {-1: array('I')}
+
+        # Nodes in order of their opening lines, indexed by row of opening line
+        self.nodes = []
+        self.rowNodes = {}
+        self._openNodes = []
+        self._parentRow = -1
+        self._siblings = self.children[-1]
+
+        # Text search index, built when all lines are loaded
+        self.searchIndex = None
+
+        # Interned real paths of source files
+        self.files = []
+        self.fileNames = []
+        self._fileIndex = {}
+        self._realDirs = {}
+
+        # Source positions parsed from "file:line:col-line:col" annotations, one entry per
+        # distinct annotation in the columns below, rows refer to them by sourceIds
+        self.sourceFileIds = array('i')
+        self.sourceStartLines = array('I')
+        self.sourceStartCols = array('I')
+        self.sourceEndLines = array('I')
+        self.sourceEndCols = array('I')
+        self._sourceIndex = {}
+
+        # Include chains of lines annotated by several files, tuples of sourceIds of the including
+        # lines from the innermost one, rows refer to them by chainIds (-1 for none)
+        self.chains = []
+        self._chainIndex = {}
+
+        # Rows of lines contributed by each file
+        self._fileRows = {}
+
+    def __len__(self):
+        return len(self.lineNums)
+
+    def fileName(self, row):
+        fileId = self.fileIds[row]
+        return self.fileNames[fileId] if fileId >= 0 else ''
+
+    def filePath(self, row):
+        fileId = self.fileIds[row]
+        return self.files[fileId] if fileId >= 0 else ''
+
+    def source(self, row):
+        # Annotation of the row in "file:line:col-line:col" format
+        return self.sourceText(self.sourceIds[row])
+
+    def sourceText(self, sourceId):
+        if sourceId < 0:
+            return ''
+        return '{}:{}:{}-{}:{}'.format(self.files[self.sourceFileIds[sourceId]],
+                                       self.sourceStartLines[sourceId], self.sourceStartCols[sourceId],
+                                       self.sourceEndLines[sourceId], self.sourceEndCols[sourceId])
+
+    def fileId(self, filePath):
+        return self._fileIndex.get(filePath, -1)
+
+    def rowsOfFile(self, fileId):
+        return self._fileRows.get(fileId, ())
+
+    def lineCounts(self):
+        # Count of lines contributed by each file (real path)
+        return {self.files[fileId]: len(rows) for fileId, rows in self._fileRows.items()}
+
+    def chain(self, row):
+        # SourceIds of the lines which include the source of the row
+        chainId = self.chainIds[row]
+        return self.chains[chainId] if chainId >= 0 else ()
+
+    def sourceRange(self, sourceId):
+        # Source file and its first and last line
+        return (self.files[self.sourceFileIds[sourceId]],
+                self.sourceStartLines[sourceId], self.sourceEndLines[sourceId])
+
+    def nodeOf(self, row):
+        # Innermost node which contains the row
+        node = self.rowNodes.get(row)
+        if node is None:
+            node = self.rowNodes.get(self.parentRows[row])
+        return node
+
+    def realPath(self, fileWithLineNums):
+        # realpath() of "file:line..." string resolves only the directory part,
+        # cache it per directory as it is the same for most of the lines
+        idx = fileWithLineNums.rfind('/') + 1
+        dirName = fileWithLineNums[:idx]
+        realDir = self._realDirs.get(dirName)
+        if realDir is None:
+            realDir = self._realDirs[dirName] = os.path.join(os.path.realpath(dirName), '')
+        return realDir + fileWithLineNums[idx:]
+
+    def internFile(self, filePath):
+        fileId = self._fileIndex.get(filePath)
+        if fileId is None:
+            fileId = self._fileIndex[filePath] = len(self.files)
+            self.files.append(filePath)
+            # Filename is the last (rightmost) word in a forward-slash-separetd path string
+            self.fileNames.append(filePath.split('/')[-1])
+        return fileId
+
+    def internSource(self, fileWithLineNums):
+        # Each distinct annotation is parsed only once
+        sourceId = self._sourceIndex.get(fileWithLineNums)
+        if sourceId is None:
+            match = SOURCE_RE.match(fileWithLineNums)
+            if match:
+                filePath, startLine, startCol, endLine, endCol = match.groups()
+            else:
+                match = SOURCE_LINE_RE.match(fileWithLineNums)
+                if match:
+                    filePath, startLine = match.groups()
+                else:
+                    filePath, startLine = fileWithLineNums.split(':', 1)[0], 0
+                startCol, endLine, endCol = 0, startLine, 0
+            sourceId = self._sourceIndex[fileWithLineNums] = len(self.sourceFileIds)
+            self.sourceFileIds.append(self.internFile(filePath))
+            self.sourceStartLines.append(int(startLine))
+            self.sourceStartCols.append(int(startCol))
+            self.sourceEndLines.append(int(endLine))
+            self.sourceEndCols.append(int(endCol))
+        return sourceId
+
+    def internChain(self, filesWithLineNums):
+        chain = tuple(self.internSource(f) for f in filesWithLineNums)
+        chainId = self._chainIndex.get(chain)
+        if chainId is None:
+            chainId = self._chainIndex[chain] = len(self.chains)
+            self.chains.append(chain)
+        return chainId
+
+    def addRow(self, lineNum, lineContents, fileWithLineNums, flags, chainId=-1):
+        if fileWithLineNums:
+            sourceId = self.internSource(fileWithLineNums)
+            fileId = self.sourceFileIds[sourceId]
+        else:
+            sourceId = -1
+            fileId = -1
+        self.lineNums.append(lineNum)
+        self.contents.append(lineContents)
+        self.fileIds.append(fileId)
+        self.sourceIds.append(sourceId)
+        self.chainIds.append(chainId)
+        self.flags.append(flags)
+        if fileId >= 0:
+            fileRows = self._fileRows.get(fileId)
+            if fileRows is None:
+                fileRows = self._fileRows[fileId] = array('I')
+            fileRows.append(len(self.lineNums) - 1)
+
+        siblings = self._siblings
+        self.parentRows.append(self._parentRow)
+        self.childPos.append(len(siblings))
+        siblings.append(len(self.lineNums) - 1)
+
+    def openNode(self, lineNum, lineContents):
+        # Node name is the title of line without labels
+        name = lineContents.replace("{", "").strip().rsplit(':', 1)[-1].strip()
+        row = len(self.lineNums) - 1
+        if self._openNodes:
+            parent = self._openNodes[-1]
+            path = parent.path.rstrip('/') + '/' + name
+        else:
+            path = name
+        node = DTSNode(path, len(self._openNodes), lineNum, row)
+        self.nodes.append(node)
+        self.rowNodes[row] = node
+        self._openNodes.append(node)
+        self._parentRow = row
+        self._siblings = self.children[row] = array('I')
+
+    def closeNode(self, lineNum):
+        # Closing bracket without opening one is ignored
+        if self._openNodes:
+            self._openNodes.pop().endLine = lineNum
+            self._parentRow = self._openNodes[-1].row if self._openNodes else -1
+            self._siblings = self.children[self._parentRow]
+
+    def addLine(self, lineNum, line):
+
+        # Look for the code (part before the "/*" comment)
+        idx = line.rfind("/*")
+
+        if idx < 0:
+            lineContents = line.strip()
+        else:
+            lineContents = line[:idx].rstrip()
+
+        if idx > 0:
+            # Now pick the comment part of the line
+            commentFileList = line[idx+2:].strip()[:-2]
+            # Remove false positive
+            if "<no-file>:<no-line>" in commentFileList:
+                commentFileList = None
+        else:
+            commentFileList = None
+
+        # If found, then clean-up
+        if commentFileList:
+            # The last (rightmost) file in the comma-separted list of filename:lineno
+            # Line numbers are made-up of integers after a ":" colon.
+            listOfSourcefiles = [self.realPath(f.strip()) for f in commentFileList.split(',')]
+            fileWithLineNums = listOfSourcefiles[-1]
+        else:
+            fileWithLineNums = ''
+
+        # skip empty line
+        if not fileWithLineNums and not lineContents.lstrip():
+            return
+
+        flags = 0
+
+        # find deleted tag
+        isDeleted = DELETED_TAG in lineContents
+        if isDeleted:
+            # remove deleted tag and uncomment content
+            lineContents = lineContents.replace('/* ' + DELETED_TAG + ' */ ', '')
+            lineContents = re.sub(r'/\*(.*)?\*/\s*', r'\g<1>', lineContents, flags=re.S)
+            flags |= self.FLAG_DELETED
+        elif not commentFileList:
+            flags |= self.FLAG_NO_SOURCE
+
+        # Include parents are kept with the line, the view shows them on demand
+        # Skip add parents for close bracket of node
+        chainId = -1
+        if commentFileList and len(listOfSourcefiles) > 1 and not (isDeleted and "};" in lineContents.strip()):
+            chainId = self.internChain(listOfSourcefiles[-2::-1])
+
+        self.addRow(lineNum, lineContents, fileWithLineNums, flags, chainId)
+
+        # Following rows up to the closing bracket are children of this line
+        if "{" in lineContents:
+            self.openNode(lineNum, lineContents)
+
+        if "}" in lineContents:
+            self.closeNode(lineNum)
+
+    def load(self, f):
+        # Read each line in the DTS file
+        for lineNum, line in enumerate(f, 1):
+            self.addLine(lineNum, line)
+
+
+class DTSModel(QtCore.QAbstractItemModel):
+
+    HEADERS = ['Line No.', 'DTS content ....', 'Source File', 'Full path']
+
+    # Rows highlighted as found by text search or as lines of a file changed
+    highlightChanged = QtCore.pyqtSignal()
+
+    # Internal id of an index is the table row shifted by CHAIN_BITS, low bits are position of
+    # the include parent (counted from 1) when the index is a child showing the include chain of the row
+    CHAIN_BITS = 8
+    CHAIN_MASK = (1 << CHAIN_BITS) - 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.table = DTSLineTable()
+        self.rowsShown = 0
+        # Count of shown children per parent row
+        self._shownChildren = {}
+
+        # Colors and fonts are shared by all rows, file colors are cached per file
+        self._fileBackgrounds = {}
+        self._whiteBackground = QColor(255, 255, 255)
+        self._deletedForeground = QColor(255, 0, 0)
+        self._noSourceForeground = QColor(175, 175, 175)
+        self._parentForeground = QColor(255, 255, 255)
+        self._deletedFont = QtGui.QFont()
+        self._deletedFont.setStrikeOut(True)
+        self._deletedFont.setBold(True)
+
+        # Rows found by text search are highlighted
+        self._matches = set()
+        self._matchBackground = QColor(255, 220, 0)
+        self._highlightedFile = -1
+        self._fileHighlightBackground = QColor(150, 200, 255)
+
+    def setTable(self, table, rowsShown=None):
+        # The table may be still loading, only first rowsShown rows are shown
+        self.beginResetModel()
+        self.table = table
+        self.rowsShown = len(table) if rowsShown is None else rowsShown
+        self._shownChildren = {}
+        for row in range(self.rowsShown):
+            self._shownChildren[table.parentRows[row]] = table.childPos[row] + 1
+        self._fileBackgrounds = {}
+        self._matches = set()
+        self._highlightedFile = -1
+        self.endResetModel()
+
+    def showRows(self, count):
+        table = self.table
+        # New children of each parent follow the ones already shown,
+        # parents are visited in order of first appearance, so a parent is shown before its children
+        lastPos = {}
+        for row in range(self.rowsShown, count):
+            lastPos[table.parentRows[row]] = table.childPos[row]
+        for parentRow, last in lastPos.items():
+            parent = self.rowIndex(parentRow) if parentRow >= 0 else QModelIndex()
+            # Include parents of a line precede the lines of its node
+            first = self.chainLength(parentRow)
+            self.beginInsertRows(parent, first + self._shownChildren.get(parentRow, 0), first + last)
+            self._shownChildren[parentRow] = last + 1
+            self.endInsertRows()
+        self.rowsShown = max(count, self.rowsShown)
+
+    def setMatches(self, rows):
+        self._matches = set(rows)
+        # dataChanged of all rows is slow in QTreeView, views only have to repaint visible rows
+        self.highlightChanged.emit()
+
+    def setHighlightedFile(self, fileId):
+        # Lines contributed by the file are highlighted, -1 for none
+        self._highlightedFile = fileId
+        self.highlightChanged.emit()
+
+    def clear(self):
+        self.setTable(DTSLineTable())
+
+    def fileBackground(self, fileId):
+        bgColor = self._fileBackgrounds.get(fileId)
+        if bgColor is None:
+            # Pick a different background color for each filename
+            includedFilename = self.table.fileNames[fileId]
+            colorHash = (int(hashlib.sha1(includedFilename.encode('utf-8')).hexdigest(), 16) % 16) * 4
+            bgColor = self._fileBackgrounds[fileId] = QColor(255-colorHash*2, 240, 192+colorHash)
+        return bgColor
+
+    def tableRow(self, index):
+        return index.internalId() >> self.CHAIN_BITS if index.isValid() else -1
+
+    def chainPos(self, index):
+        # Position of include parent in the chain (from 1), 0 for index of the line itself
+        return index.internalId() & self.CHAIN_MASK if index.isValid() else 0
+
+    def chainLength(self, row):
+        return len(self.table.chain(row)) if row >= 0 else 0
+
+    def sourceId(self, index):
+        row = self.tableRow(index)
+        if row < 0:
+            return -1
+        chainPos = self.chainPos(index)
+        if chainPos:
+            return self.table.chain(row)[chainPos - 1]
+        return self.table.sourceIds[row]
+
+    def rowIndex(self, row, column=0):
+        position = self.chainLength(self.table.parentRows[row]) + self.table.childPos[row]
+        return self.createIndex(position, column, row << self.CHAIN_BITS)
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.column() > 0 or not 0 <= column < len(self.HEADERS) or self.chainPos(parent):
+            return QModelIndex()
+        parentRow = self.tableRow(parent)
+        chainLength = self.chainLength(parentRow)
+        if 0 <= row < chainLength:
+            # Include parents are created only when the line is expanded
+            return self.createIndex(row, column, (parentRow << self.CHAIN_BITS) | (row + 1))
+        if not 0 <= row - chainLength < self._shownChildren.get(parentRow, 0):
+            return QModelIndex()
+        return self.createIndex(row, column, self.table.children[parentRow][row - chainLength] << self.CHAIN_BITS)
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        row = self.tableRow(index)
+        if self.chainPos(index):
+            return self.rowIndex(row)
+        parentRow = self.table.parentRows[row]
+        if parentRow < 0:
+            return QModelIndex()
+        return self.rowIndex(parentRow)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0 or self.chainPos(parent):
+            return 0
+        parentRow = self.tableRow(parent)
+        return self.chainLength(parentRow) + self._shownChildren.get(parentRow, 0)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def chainData(self, row, sourceId, column, role):
+        # Include parent of the line, shown with line number of the line and source of the including line
+        table = self.table
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return str(table.lineNums[row])
+            if column == 1:
+                return ''
+            if column == 2:
+                return table.fileNames[table.sourceFileIds[sourceId]]
+            return table.sourceText(sourceId)
+        if role == Qt.ItemDataRole.ForegroundRole and column == 0:
+            return self._parentForeground
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        table = self.table
+        row = self.tableRow(index)
+        column = index.column()
+        chainPos = self.chainPos(index)
+        if chainPos:
+            return self.chainData(row, table.chain(row)[chainPos - 1], column, role)
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return str(table.lineNums[row])
+            if column == 1:
+                return table.contents[row]
+            if column == 2:
+                return table.fileName(row)
+            return table.source(row)
+
+        flags = table.flags[row]
+        if role == Qt.ItemDataRole.BackgroundRole:
+            if row in self._matches:
+                return self._matchBackground
+            if table.fileIds[row] == self._highlightedFile >= 0:
+                return self._fileHighlightBackground
+            if column == 1:
+                fileId = table.fileIds[row]
+                return self.fileBackground(fileId) if fileId >= 0 else self._whiteBackground
+        elif role == Qt.ItemDataRole.ForegroundRole:
+            if column == 1:
+                if flags & DTSLineTable.FLAG_DELETED:
+                    return self._deletedForeground
+                if flags & DTSLineTable.FLAG_NO_SOURCE:
+                    return self._noSourceForeground
+        elif role == Qt.ItemDataRole.FontRole:
+            if column == 1 and flags & DTSLineTable.FLAG_DELETED:
+                return self._deletedFont
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            # Include chain of the line, without creating its child rows
+            chain = table.chain(row)
+            if chain:
+                return '\n'.join(['Included from:'] + [table.sourceText(sourceId) for sourceId in chain])
+        return None
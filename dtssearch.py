@@ -0,0 +1,83 @@
+import re
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+
+class DTSSearchIndex(object):
+
+    def __init__(self, lines):
+        # Lines are joined into one text, so a query is searched by str.find() or re over the whole file
+        # and the position of a match is mapped to its line by bisection of line offsets
+        self.lines = lines
+        self.count = len(lines)
+        self._text, self._offsets = self.joinLines(lines)
+
+        # Lowercase copy for case-insensitive search, lower() may change length of a line
+        self._lowerLines = [line.lower() for line in lines]
+        self._lowerText, self._lowerOffsets = self.joinLines(self._lowerLines)
+
+        # Previous query and its result, used to refine the result while typing
+        self._last = None
+
+    @staticmethod
+    def joinLines(lines):
+        text = '\n'.join(lines) + '\n'
+        offsets = array('I', accumulate((len(line) + 1 for line in lines), initial=0))
+        return text, offsets
+
+    def searchText(self, query, text, offsets):
+        rows = []
+        find = text.find
+        pos = find(query)
+        while pos >= 0:
+            row = bisect_right(offsets, pos) - 1
+            rows.append(row)
+            # Each line is found once, continue from the next one
+            pos = find(query, offsets[row + 1])
+        return rows
+
+    def searchRegex(self, pattern):
+        rows = []
+        offsets = self._offsets
+        text = self._text
+        end = len(text)
+        search = pattern.search
+        match = search(text)
+        while match:
+            row = bisect_right(offsets, match.start()) - 1
+            if row >= self.count:
+                break
+            # A match which continues on next lines (e.g. by \s) counts only if the line matches alone
+            if match.end() < offsets[row + 1] or pattern.search(self.lines[row]):
+                rows.append(row)
+            if offsets[row + 1] >= end:
+                break
+            match = search(text, offsets[row + 1])
+        return rows
+
+    def search(self, query, caseSensitive=False, regex=False):
+        # Returns rows of lines which match the query, raises re.error for invalid regular expression
+        if not query:
+            return []
+
+        last = self._last
+        if regex:
+            flags = re.MULTILINE if caseSensitive else re.MULTILINE | re.IGNORECASE
+            rows = self.searchRegex(re.compile(query, flags))
+        elif caseSensitive:
+            if last and last[1:3] == (True, False) and query.startswith(last[0]):
+                # Lines which contain longer query are among the lines found by its prefix
+                rows = [row for row in last[3] if query in self.lines[row]]
+            else:
+                rows = self.searchText(query, self._text, self._offsets)
+        else:
+            lowerQuery = query.lower()
+            if last and last[1:3] == (False, False) and lowerQuery.startswith(last[0].lower()):
+                lowerLines = self._lowerLines
+                rows = [row for row in last[3] if lowerQuery in lowerLines[row]]
+            else:
+                rows = self.searchText(lowerQuery, self._lowerText, self._lowerOffsets)
+
+        self._last = (query, caseSensitive, regex, rows)
+        return rows
@@ -2,8 +2,6 @@
 
 import ast
 import configparser
-import hashlib
-import json
 import os
 import re
 import string
@@ -11,233 +9,48 @@ import subprocess
 from subprocess import PIPE
 import sys
 
-from includetree import includeTree
-from helper import loadConfig, annotateDTS, ConfigHelper
+from helper import ConfigHelper, SourceCache
 from merge import mergeDts
+from includetree import IncludeTreeModel
+from dtsmodel import DTSLineTable, DTSModel
+from pipeline import DTSPipeline
+from dtssearch import DTSSearchIndex
 
-from PyQt6.QtGui import QColor, QDesktopServices
+from PyQt6.QtGui import QDesktopServices
 from PyQt6 import QtCore, QtGui, QtWidgets, uic
-from PyQt6.QtWidgets import QApplication, QMainWindow, QFileDialog, QDialog, QHeaderView, QMessageBox, QTreeWidgetItem, \
-    QWidget
+from PyQt6.QtWidgets import QApplication, QMainWindow, QFileDialog, QDialog, QHeaderView, QMessageBox, QWidget
 from PyQt6.uic import loadUi
 
 import qdarktheme
 
-from queue import Queue
-
-DELETED_TAG = "__[|>*DELETED*<|]__"
-
-def getTopLevelItem(trwDT):
-    return trwDT.topLevelItem(trwDT.topLevelItemCount()-1)
-
-def populateDTS(trwDT, trwIncludedFiles, filename):
-    left_bracket_count = 0
-    right_bracket_count = 0
-    # 宣告一個存放line的list
-    #line_temp = []
-    lines_dict = {}
-
-    # Clear remnants from previously opened file
-    trwDT.clear()
-    trwIncludedFiles.expandAll()
-
-    with open (filename) as f:
-
-        # Read each line in the DTS file
-        lineNum = 1
-        for line in f:
-
-            # Look for the code (part before the "/*" comment)
-            idx = line.rfind("/*")
-
-            if idx < 0:
-                lineContents = line.strip()
-            else:
-                lineContents = line[:idx].rstrip()
-
-            if idx > 0:
-                # Now pick the comment part of the line
-                commentFileList = line[idx+2:].strip()[:-2]
-                # Remove false positive
-                if "<no-file>:<no-line>" in commentFileList:
-                    commentFileList = None
-            else:
-                commentFileList = None
-
-            # If found, then clean-up
-            if commentFileList:
-                # The last (rightmost) file in the comma-separted list of filename:lineno
-                # Line numbers are made-up of integers after a ":" colon.
-                listOfSourcefiles = list(map(lambda f: os.path.realpath(f.strip()), commentFileList.split(',')))
-                fileWithLineNums = listOfSourcefiles[-1]
-
-                if fileWithLineNums:
-                    # Filename is the last (rightmost) word in a forward-slash-separetd path string
-                    includedFilename = fileWithLineNums.split(':', 1)[0].split('/')[-1]
-            else:
-                fileWithLineNums = ''
-
-            if not fileWithLineNums:
-                includedFilename = ''
-
-                # skip empty line
-                if not (lineContents.lstrip()):
-                    lineNum += 1
-                    continue
-
-            # find deleted tag
-            isDeleted = DELETED_TAG in lineContents
-            if isDeleted:
-                # remove deleted tag and uncomment content
-                lineContents = lineContents.replace('/* ' + DELETED_TAG + ' */ ', '')
-                lineContents = re.sub(r'/\*(.*)?\*/\s*', r'\g<1>', lineContents, flags=re.S)
-
-            # Add line to the list
-            rowItem = QtWidgets.QTreeWidgetItem([str(lineNum), lineContents, includedFilename, fileWithLineNums])
-            trwDT.addTopLevelItem(rowItem)
-            #line_temp.append(lineContents)
-            lines_dict[lineNum] = lineContents
-
-            if "{" in lineContents:
-                left_bracket_count += 1
-            if "}" in lineContents:
-                right_bracket_count += 1
-
-            # Pick a different background color for each filename
-            if includedFilename:
-                colorHash = (int(hashlib.sha1(includedFilename.encode('utf-8')).hexdigest(), 16) % 16) * 4
-                prevColorHash = colorHash
-                bgColor = QColor(255-colorHash*2, 240, 192+colorHash)
-            else:
-                bgColor = QColor(255, 255, 255)
-
-            rowItem.setBackground(1, bgColor)
-
-            if isDeleted:
-                rowItem.setForeground(1, QColor(255, 0, 0))
-                f = rowItem.font(0)
-                f.setStrikeOut(True)
-                f.setBold(True)
-                rowItem.setFont(1, f)
-
-            # Include parents
-            if commentFileList:
-                # Skip add parents for close bracket of node
-                if not (isDeleted and "};" in lineContents.strip()):
-                    for fileWithLineNums in listOfSourcefiles[-2::-1]:
-                        strippedLineNums = fileWithLineNums.split(':', 1)[0]
-                        includedFilename = strippedLineNums.split('/')[-1]
-                        rowItem = QtWidgets.QTreeWidgetItem([str(lineNum), "", includedFilename, fileWithLineNums])
-                        trwDT.addTopLevelItem(rowItem)
-                        item = getTopLevelItem(trwDT)
-                        item.setForeground(0, QColor(255, 255, 255));
-            elif not isDeleted:
-                item = getTopLevelItem(trwDT)
-                item.setForeground(1, QColor(175, 175, 175))
-                f = item.font(0)
-                item.setFont(1, f)
-
-            lineNum += 1
-
-        print("count of left brackets = {}, count of right brackets = {}".format(left_bracket_count, right_bracket_count))
-
-        left_Bracket_index = None
-        right_Bracket_index = None
-
-        in_the_end = False
-
-        while not in_the_end:
-            # 產生一個暫存的list，將lines_dict的value轉換成list（不建議用 index 取 key）
-            keys_sorted = sorted(lines_dict.keys())
-            line_temp = [lines_dict[k] for k in keys_sorted]
-
-            right_Bracket_index = None
-            for key in keys_sorted:
-                if "}" in lines_dict[key]:
-                    right_Bracket_index = key
-                    break
-                if key == keys_sorted[-1]:
-                    in_the_end = True
-                    right_Bracket_index = None
-                    break
-
-            if right_Bracket_index is not None:
-                # 從右括號開始往前找左括號
-                left_Bracket_index = None
-                for k in reversed(keys_sorted):
-                    if k > right_Bracket_index:
-                        continue
-                    if "{" in lines_dict[k]:
-                        left_Bracket_index = k
-                        break
-
-                if left_Bracket_index is not None:
-                    tree_title = lines_dict[left_Bracket_index].replace("{", "").strip()
-
-
-                    print(f"Tree Title: {tree_title}, Lines starting from {left_Bracket_index} to {right_Bracket_index}")
-
-                    # 清除已處理的行
-                    keys_to_delete = [k for k in keys_sorted if left_Bracket_index <= k <= right_Bracket_index]
-                    for k in keys_to_delete:
-                        if k in lines_dict:
-                            del lines_dict[k]
-
-                    left_Bracket_index = None
-                    right_Bracket_index = None
-
-
-
-
-
-def populateIncludedFiles(trwIncludedFiles, dtsFile, inputIncludeDirs):
-
-    trwIncludedFiles.clear()
-    dtsIncludeTree = includeTree(dtsFile, inputIncludeDirs)
-    dummyItem = QtWidgets.QTreeWidgetItem()
-    dtsIncludeTree.populateChildrenFileNames(dummyItem)
-    trwIncludedFiles.addTopLevelItem(dummyItem.child(0).clone())
-
-def highlightFileInTree(trwIncludedFiles, fileWithLineNums):
-    filePath = fileWithLineNums.split(':', 1)[0]
-    fileName = filePath.split('/')[-1]
-    items = trwIncludedFiles.findItems(fileName, QtCore.Qt.MatchFlag.MatchRecursive)
-    currItem = next(item for item in items if item.toolTip(0) == filePath)
+from bisect import bisect_left
 
-    # highlight/select current item
-    trwIncludedFiles.setCurrentItem(currItem)
-
-    # highlight/select all its parent items
-    while (currItem.parent()):
-        currItem = currItem.parent()
-        currItem.setSelected(True)
-
-def getLines(fileName, startLineNum, endLineNum):
-
-    lines = ''
+# Contents of source files shown in the preview label
+sourceCache = SourceCache()
 
-    with open(fileName) as f:
-        fileLines = f.readlines()
-
-        if (startLineNum == endLineNum):
-            lines = fileLines[startLineNum-1]
-        else:
-            for line in range(startLineNum-1, endLineNum):
-                lines += fileLines[line]
+def highlightFileInTree(trwIncludedFiles, filePath):
+    includeModel = trwIncludedFiles.model()
+    currIndex = includeModel.fileIndex(filePath)
+    if not currIndex.isValid():
+        # File is not in the tree (e.g. a header file)
+        trwIncludedFiles.clearSelection()
+        return
 
-    return lines
+    # highlight/select current item
+    trwIncludedFiles.setCurrentIndex(currIndex)
 
-def showOriginalLineinLabel(lblDT, lineNum, fileWithLineNums):
+    # highlight/select all its parent items
+    selectionModel = trwIncludedFiles.selectionModel()
+    while (currIndex.parent().isValid()):
+        currIndex = currIndex.parent()
+        selectionModel.select(currIndex, QtCore.QItemSelectionModel.SelectionFlag.Select |
+                              QtCore.QItemSelectionModel.SelectionFlag.Rows)
 
-    filePath = fileWithLineNums.split(':', 1)[0]
+def showOriginalLineinLabel(lblDT, filePath, startLineNum, endLineNum):
 
-    # extract line numbers in source-file
     # TODO: Special Handling for opening and closing braces in DTS
     #       (no need to show ENTIRE node, right?)
-    startLineNum = int(re.split('[[:-]', fileWithLineNums)[-4].strip())
-    endLineNum = int(re.split('[[:-]', fileWithLineNums)[-2].strip())
-    #print('Line='+str(lineNum), 'Source='+filePath, startLineNum, 'to', endLineNum)
-    lblDT.setText(getLines(filePath, startLineNum, endLineNum))
+    lblDT.setText(sourceCache.get_lines(filePath, startLineNum, endLineNum))
 
 def center(window):
 
@@ -319,8 +132,16 @@ class main(QMainWindow):
         self.load_ui()
         self.load_signals()
         self.findStr = None
+        self.findOptions = None
+        self.findIndex = None
+        self.findError = None
+        self.partialSearchIndex = None
         self.foundList = []
         self.foundIndex = 0
+        self.pipeline = None
+        self.highlightingSourceFile = False
+        self.nodesShown = 0
+        self.runningPipelines = set()
 
         argc = len(sys.argv)
 
@@ -356,52 +177,135 @@ class main(QMainWindow):
             self.ui.setWindowTitle("DTV - " + fileName)
 
             self.findStr = None
+            self.findOptions = None
+            self.findIndex = None
+            self.findError = None
+            self.partialSearchIndex = None
             self.foundList = []
             self.foundIndex = 0
-
-            annotatedTmpDTSFileName = None
-            try:
-                if baseDtsFileName:
-                    incIncludes = loadConfig(baseDtsFileName)
-                else:
-                    incIncludes = loadConfig(fileName)
-
-                # Resolve symlinks in path
-                fileName = os.path.realpath(fileName)
-                annotatedTmpDTSFileName = annotateDTS(fileName, incIncludes)
-                populateIncludedFiles(self.ui.trwIncludedFiles, fileName, incIncludes)
-                populateDTS(self.ui.trwDT, self.ui.trwIncludedFiles, annotatedTmpDTSFileName)
-            except Exception as e:
-                print('EXCEPTION!', e)
-                #exit(1)
-            finally:
-                # Delete temporary file if created
-                if annotatedTmpDTSFileName:
-                    try:
-                        os.remove(annotatedTmpDTSFileName)
-                    except OSError:
-                        pass
+            self.lblFindCount.setText('')
+
+            # Cancel loading of previously opened file
+            if self.pipeline is not None:
+                self.pipeline.cancel()
+
+            # Clear remnants from previously opened file
+            self.includeModel.clear()
+            table = DTSLineTable()
+            self.dtsModel.setTable(table, 0)
+            self.nodesShown = 0
+            self.lblNodePath.setText('')
+
+            # Run cpp, dtc and load the result in background, rows are shown in batches
+            pipeline = DTSPipeline(fileName, baseDtsFileName, table)
+            pipeline.signals.stageStarted.connect(lambda stage, name: self.pipelineStageStarted(pipeline, stage, name))
+            pipeline.signals.progress.connect(lambda value, maximum: self.pipelineProgress(pipeline, value, maximum))
+            pipeline.signals.includeTreeReady.connect(lambda tree: self.pipelineIncludeTreeReady(pipeline, tree))
+            pipeline.signals.rowsReady.connect(lambda count: self.pipelineRowsReady(pipeline, count))
+            pipeline.signals.finished.connect(lambda: self.pipelineDone(pipeline, None))
+            pipeline.signals.failed.connect(lambda error: self.pipelineDone(pipeline, error))
+            pipeline.signals.cancelled.connect(lambda: self.pipelineDone(pipeline, None))
+            self.pipeline = pipeline
+            self.runningPipelines.add(pipeline)
+            self.progressBar.setRange(0, 0)
+            self.progressBar.show()
+            self.btnCancelLoad.show()
+            QtCore.QThreadPool.globalInstance().start(pipeline)
 
             self.trwDT.header().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
             self.trwDT.header().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
             self.trwDT.header().setSectionHidden(3, True)
             self.trwDT.header().resizeSection(1, 500)
 
+    def closeEvent(self, event):
+        # Stop background loading before the window is destroyed
+        for pipeline in self.runningPipelines:
+            pipeline.cancel()
+        QtCore.QThreadPool.globalInstance().waitForDone()
+        super().closeEvent(event)
+
+    def cancelLoading(self):
+        if self.pipeline is not None:
+            self.pipeline.cancel()
+            self.statusBar().showMessage('Cancelling...')
+
+    def pipelineStageStarted(self, pipeline, stage, name):
+        if pipeline is self.pipeline:
+            self.statusBar().showMessage('{} ({}/{})'.format(name, stage + 1, len(DTSPipeline.STAGES)))
+
+    def pipelineProgress(self, pipeline, value, maximum):
+        if pipeline is self.pipeline:
+            self.progressBar.setRange(0, maximum)
+            self.progressBar.setValue(value)
+
+    def pipelineIncludeTreeReady(self, pipeline, dtsIncludeTree):
+        if pipeline is self.pipeline:
+            self.includeModel.setIncludeTree(dtsIncludeTree)
+            self.ui.trwIncludedFiles.expandAll()
+            # Make the top file current for keyboard navigation, without selecting it
+            self.highlightingSourceFile = True
+            self.ui.trwIncludedFiles.selectionModel().setCurrentIndex(
+                self.includeModel.index(0, 0), QtCore.QItemSelectionModel.SelectionFlag.NoUpdate)
+            self.highlightingSourceFile = False
+
+    def pipelineRowsReady(self, pipeline, count):
+        if pipeline is self.pipeline:
+            self.dtsModel.showRows(count)
+            # Expand top-level nodes while loading, expanding each node is slow for large files
+            nodes = self.dtsModel.table.nodes
+            while self.nodesShown < len(nodes) and nodes[self.nodesShown].row < count:
+                if nodes[self.nodesShown].depth == 0:
+                    self.ui.trwDT.expand(self.dtsModel.rowIndex(nodes[self.nodesShown].row))
+                self.nodesShown += 1
+
+    def pipelineDone(self, pipeline, error):
+        self.runningPipelines.discard(pipeline)
+        if pipeline is not self.pipeline:
+            return
+        self.pipeline = None
+        self.progressBar.hide()
+        self.btnCancelLoad.hide()
+        self.includeModel.setLineCounts(self.dtsModel.table.lineCounts())
+        # Refresh matches of a search started while loading
+        if self.findStr and self.updateSearch():
+            self.showFindCount()
+        if error is not None:
+            print('EXCEPTION!', error)
+            self.statusBar().showMessage('Failed: ' + error)
+        elif pipeline.isCancelled():
+            self.statusBar().showMessage('Cancelled')
+        else:
+            self.statusBar().showMessage('{} lines loaded'.format(self.dtsModel.rowsShown), 5000)
+
     def highlightSourceFile(self):
 
         # Skip if no "current" row
-        if self.ui.trwDT.currentItem() is None:
+        currentIndex = self.ui.trwDT.currentIndex()
+        row = self.dtsModel.tableRow(currentIndex)
+        if row < 0:
             return
 
+        # Show the node which contains the current row
+        table = self.dtsModel.table
+        node = table.nodeOf(row)
+        if node is not None:
+            self.lblNodePath.setText('{} (lines {}-{})'.format(node.path, node.startLine, node.endLine or '?'))
+        else:
+            self.lblNodePath.setText('')
+
         # Skip if current row is "whitespace"
-        if self.ui.trwDT.currentItem().text(2) == '':
+        sourceId = self.dtsModel.sourceId(currentIndex)
+        if sourceId < 0:
             self.ui.lblDT.setText('')
             return
 
         # Else identify and highlight the source file of the current row
-        if self.ui.trwDT.currentItem():
-            highlightFileInTree(self.ui.trwIncludedFiles, self.ui.trwDT.currentItem().text(3))
-            showOriginalLineinLabel(self.ui.lblDT, int(self.ui.trwDT.currentItem().text(0)), self.ui.trwDT.currentItem().text(3))
+        # (without highlighting lines of the file as if user selected it)
+        filePath, startLineNum, endLineNum = table.sourceRange(sourceId)
+        self.highlightingSourceFile = True
+        highlightFileInTree(self.ui.trwIncludedFiles, filePath)
+        self.highlightingSourceFile = False
+        showOriginalLineinLabel(self.ui.lblDT, filePath, startLineNum, endLineNum)
 
     def launchEditor(self, srcFileName, srcLineNum):
 
@@ -427,40 +331,107 @@ class main(QMainWindow):
 
     def editSourceFile(self):
 
-        # TODO: Refactor. Same logic used by showOriginalLineinLabel() too
-        lineNum = int(self.ui.trwDT.currentItem().text(0))
-        fileWithLineNums = self.ui.trwDT.currentItem().text(3)
-        dtsiFileName = fileWithLineNums.split(':')[0].strip()
-        if dtsiFileName == '':
+        currentIndex = self.ui.trwDT.currentIndex()
+        if not currentIndex.isValid():
+            return
+        sourceId = self.dtsModel.sourceId(currentIndex)
+        if sourceId < 0:
             QMessageBox.information(self,
                                     'DTV',
                                     'No file for the curent line',
                                     QMessageBox.StandardButton.Ok)
             return
 
-        dtsiLineNum = int(re.split('[[:-]', fileWithLineNums)[-4].strip())
+        dtsiFileName, dtsiLineNum, _ = self.dtsModel.table.sourceRange(sourceId)
         self.launchEditor(dtsiFileName, dtsiLineNum)
 
+    def highlightIncludedFileLines(self, currIndex):
+
+        # Highlight all DTS lines the selected file contributed
+        # (not when the file is made current for the current DTS line)
+        if self.highlightingSourceFile:
+            return
+        if not currIndex.isValid():
+            self.dtsModel.setHighlightedFile(-1)
+            return
+        table = self.dtsModel.table
+        filePath = self.includeModel.filePath(currIndex)
+        fileId = table.fileId(filePath)
+        self.dtsModel.setHighlightedFile(fileId)
+        # Rows of the file are in loading order, only the ones already shown in the view are used
+        rows = table.rowsOfFile(fileId)
+        rows = rows[:bisect_left(rows, self.dtsModel.rowsShown)]
+        self.statusBar().showMessage('{} lines from {}'.format(len(rows), filePath))
+        if rows:
+            self.trwDT.scrollTo(self.dtsModel.rowIndex(rows[0]), QtWidgets.QAbstractItemView.ScrollHint.PositionAtTop)
+
     def editIncludedFile(self):
-        includedFileName = self.ui.trwIncludedFiles.currentItem().toolTip(0)
+        includedFileName = self.includeModel.filePath(self.ui.trwIncludedFiles.currentIndex())
         self.launchEditor(includedFileName, '0')
 
-    def findTextinDTS(self):
-
+    def searchIndex(self):
+        # Index is built at the end of loading, lines loaded so far are indexed on demand
+        table = self.dtsModel.table
+        count = self.dtsModel.rowsShown
+        if table.searchIndex is not None and table.searchIndex.count == count:
+            return table.searchIndex
+        if self.partialSearchIndex is None or self.partialSearchIndex.count != count:
+            self.partialSearchIndex = DTSSearchIndex(table.contents[:count])
+        return self.partialSearchIndex
+
+    def updateSearch(self):
+        # Search again if text, options or loaded lines changed, returns True if so
         findStr = self.txtFindText.text()
+        options = (findStr, self.chkFindCase.isChecked(), self.chkFindRegex.isChecked())
+        index = self.searchIndex() if findStr else None
+        if options == self.findOptions and index is self.findIndex:
+            return False
+
+        self.findStr = findStr
+        self.findOptions = options
+        self.findIndex = index
+        self.foundIndex = 0
+        self.findError = None
+        try:
+            self.foundList = index.search(*options) if index is not None else []
+        except re.error as e:
+            self.foundList = []
+            self.findError = str(e)
+
+        self.dtsModel.setMatches(self.foundList)
+        return True
+
+    def showFindCount(self):
+        numFound = len(self.foundList)
+        self.lblFindCount.setToolTip(self.findError or '')
+        if not self.findStr:
+            self.lblFindCount.setText('')
+        elif self.findError:
+            self.lblFindCount.setText('Invalid regex')
+        elif numFound:
+            self.lblFindCount.setText('{} of {}'.format(self.foundIndex + 1, numFound))
+        else:
+            self.lblFindCount.setText('No matches')
+
+    def showFoundItem(self):
+        self.showFindCount()
+        if self.foundList:
+            index = self.dtsModel.rowIndex(self.foundList[self.foundIndex])
+            self.trwDT.setCurrentIndex(index)
+            self.trwDT.scrollTo(index, QtWidgets.QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def searchAsYouType(self):
+        if self.updateSearch():
+            self.showFoundItem()
+
+    def findTextinDTS(self):
 
         # Very common for use to click Find on empty string
-        if findStr == "":
+        if self.txtFindText.text() == "":
             return
 
-
-        # New search string ?
-        if findStr != self.findStr:
-            self.findStr = findStr
-            self.foundList = self.trwDT.findItems(self.findStr, QtCore.Qt.MatchFlag.MatchContains | QtCore.Qt.MatchFlag.MatchRecursive, column=1)
-            self.foundIndex = 0
-            numFound = len(self.foundList)
-        else:
+        # New search string or options ?
+        if not self.updateSearch():
             numFound = len(self.foundList)
             if numFound:
                 if ('Prev' in self.sender().objectName()):
@@ -470,9 +441,7 @@ class main(QMainWindow):
                     # handles btnFindNext and <Enter> on txtFindText
                     self.foundIndex = (self.foundIndex + 1) % numFound
 
-        if numFound:
-            self.trwDT.setCurrentItem(self.foundList[self.foundIndex])
-            self.trwDT.scrollToItem(self.foundList[self.foundIndex], QtWidgets.QAbstractItemView.ScrollHint.PositionAtCenter)
+        self.showFoundItem()
 
     def showSettings(self):
         #QMessageBox.information(self,
@@ -503,13 +472,47 @@ class main(QMainWindow):
         self.ui.openDTS.triggered.connect(self.openDTSFileUI)
         self.ui.exitApp.triggered.connect(self.close)
         self.ui.optionsSettings.triggered.connect(self.showSettings)
-        self.ui.trwDT.currentItemChanged.connect(self.highlightSourceFile)
-        self.ui.trwDT.itemDoubleClicked.connect(self.editSourceFile)
-        self.ui.trwIncludedFiles.itemDoubleClicked.connect(self.editIncludedFile)
+        self.dtsModel = DTSModel(self)
+        self.ui.trwDT.setModel(self.dtsModel)
+        self.ui.trwDT.selectionModel().currentChanged.connect(self.highlightSourceFile)
+        self.ui.trwDT.doubleClicked.connect(self.editSourceFile)
+        self.dtsModel.highlightChanged.connect(self.ui.trwDT.viewport().update)
+
+        # Node of the current line and progress of file loading in status bar,
+        # messages of loading stages and results are shown next to them
+        self.lblNodePath = QtWidgets.QLabel()
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.btnCancelLoad = QtWidgets.QPushButton('Cancel')
+        self.btnCancelLoad.hide()
+        self.btnCancelLoad.clicked.connect(self.cancelLoading)
+        self.statusBar().addPermanentWidget(self.lblNodePath)
+        self.statusBar().addPermanentWidget(self.progressBar)
+        self.statusBar().addPermanentWidget(self.btnCancelLoad)
+        self.includeModel = IncludeTreeModel(self)
+        self.ui.trwIncludedFiles.setModel(self.includeModel)
+        self.ui.trwIncludedFiles.header().setStretchLastSection(False)
+        self.ui.trwIncludedFiles.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.ui.trwIncludedFiles.header().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
+        self.ui.trwIncludedFiles.header().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
+        self.ui.trwIncludedFiles.doubleClicked.connect(self.editIncludedFile)
+        self.ui.trwIncludedFiles.selectionModel().currentChanged.connect(
+            lambda currIndex, prevIndex: self.highlightIncludedFileLines(currIndex))
+        self.ui.trwIncludedFiles.clicked.connect(self.highlightIncludedFileLines)
         self.ui.btnFindPrev.clicked.connect(self.findTextinDTS)
         self.ui.btnFindNext.clicked.connect(self.findTextinDTS)
         self.ui.txtFindText.returnPressed.connect(self.findTextinDTS)
 
+        # Search as you type, after a short pause in typing
+        self.findTimer = QtCore.QTimer(self)
+        self.findTimer.setSingleShot(True)
+        self.findTimer.setInterval(150)
+        self.findTimer.timeout.connect(self.searchAsYouType)
+        self.ui.txtFindText.textChanged.connect(lambda text: self.findTimer.start())
+        self.ui.chkFindCase.toggled.connect(self.searchAsYouType)
+        self.ui.chkFindRegex.toggled.connect(self.searchAsYouType)
+
         #data = {"Project A": ["file_a.py", "file_a.txt", "something.xls"],
         #        "Project B": ["file_b.csv", "photo.jpg"],
         #        "Project C": []}
@@ -529,9 +532,6 @@ class main(QMainWindow):
         #self.ui.testTree.insertTopLevelItems(0, items)
 
 
-
-        self.trwDT.setHeaderLabels(['Line No.', 'DTS content ....', 'Source File', 'Full path'])
-
         self.center()
         self.show()
 
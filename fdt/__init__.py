@@ -13,9 +13,21 @@
 # limitations under the License.
 
 import os
+import sys
+import copy
+import json
+import hashlib
+from struct import pack
 
 from .header import Header, DTB_BEGIN_NODE, DTB_END_NODE, DTB_PROP, DTB_END, DTB_NOP
-from .items import new_property, Property, PropBytes, PropWords, PropStrings, PropVariables, PropIncBin, Node
+from .items import new_property, Property, PropBytes, PropWords, PropStrings, PropVariables, PropIncBin, Node, \
+    traverse, iter_nodes, build_node, build_property, attach, get_raw_value
+from .phandle import PhandleGraph, Reference
+from .address import AddressMap, IntervalIndex
+from .fit import FitImage
+from .convert import node_to_dict, node_from_dict, write_json
+from .blob import iter_tags, get_string, extract, scan, build_strings
+from .cache import TreeCache, DiskCache, load, parse_file, set_cache_dir
 from .misc import strip_comments, split_to_lines, get_version_info, extract_string
 
 __author__  = "Martin Olejar"
@@ -28,16 +40,43 @@ __all__     = [
     'FDT',
     'Node',
     'Header',
+    'FitImage',
     # properties
     'Property',
     'PropBytes',
     'PropWords',
     'PropStrings',
     'PropIncBin',
+    # cross references
+    'PhandleGraph',
+    # address decoding
+    'AddressMap',
+    'IntervalIndex',
+    # traversal
+    'traverse',
+    'iter_nodes',
+    # trusted construction
+    'build_node',
+    'build_property',
+    'attach',
+    # cached loading
+    'TreeCache',
+    'DiskCache',
+    'load',
+    'parse_file',
+    'set_cache_dir',
     # core methods
     'parse_dts',
     'parse_dtb',
-    'diff'
+    'parse_json',
+    'extract',
+    'scan',
+    'optimize',
+    'optimize_dtb',
+    'diff',
+    'diff_events',
+    'build_index',
+    'diff_with_index'
 ]
 
 
@@ -60,6 +99,10 @@ class FDT:
     def empty(self):
         return self.root.empty
 
+    @property
+    def frozen(self):
+        return self.root.frozen
+
     def __init__(self, header=None):
         """
         FDT class constructor
@@ -81,6 +124,26 @@ class FDT:
             msg += "{} [{}N, {}P]\n".format(path, len(nodes), len(props))
         return msg
 
+    def validate(self):
+        """ Check validity of all nodes and properties, raise ValueError if anything is invalid """
+        self.root.validate()
+
+    def freeze(self):
+        """ Make FDT Object read-only (see Node.freeze), shared objects like cached trees are frozen """
+        self.entries = tuple(self.entries)
+        self.root.freeze()
+
+    def _check_mutable(self):
+        if self.frozen:
+            raise Exception("FDT object is frozen, modify a copy")
+
+    def copy(self):
+        """ Create a modifiable copy of FDT Object """
+        new_obj = FDT(copy.copy(self.header))
+        new_obj.entries = [dict(entry) for entry in self.entries]
+        new_obj.root = self.root.copy()
+        return new_obj
+
     def get_node(self, path: str, create: bool = False) -> Node:
         """ 
         Get node object from specified path
@@ -189,7 +252,6 @@ class FDT:
         assert isinstance(name, str), "Property name must be a string type !"
 
         node = self.get_node(path)
-        nodes = []
         items = []
         pclss = {
             ItemType.PROP_BASE: Property,
@@ -197,8 +259,7 @@ class FDT:
             ItemType.PROP_WORDS: PropWords,
             ItemType.PROP_STRINGS: PropStrings
         }
-        while True:
-            nodes += node.nodes
+        for _, node in iter_nodes(node) if recursive else ((path, node),):
             if itype == ItemType.NODE or itype == ItemType.ALL:
                 if not name or node.name == name:
                     items.append(node)
@@ -209,33 +270,23 @@ class FDT:
                     if itype in pclss and type(p) is not pclss[itype]:
                         continue
                     items.append(p)
-            if not recursive or not nodes:
-                break
-            node = nodes.pop()
 
         return items
 
     def walk(self, path: str = '', relative: bool = False) -> list:
         """ 
-        Walk trough nodes and return relative/absolute path with list of sub-nodes and properties
+        Walk trough nodes in document order and return relative/absolute path with list of sub-nodes and properties
         
         :param path: The path to root node
         :param relative: True for relative or False for absolute return path
         """
-        all_nodes = []
-
         node = self.get_node(path)
-        while True:
-            all_nodes += node.nodes
-            current_path = "{}/{}".format(node.path, node.name)
-            current_path = current_path.replace('///', '/')
-            current_path = current_path.replace('//', '/')
-            if path and relative:
-                current_path = current_path.replace(path, '').lstrip('/')
+        if path and relative:
+            path = ''
+        else:
+            path = '/' + path.strip('/')
+        for current_path, node in iter_nodes(node, path):
             yield current_path, node.nodes, node.props
-            if not all_nodes:
-                break
-            node = all_nodes.pop()
 
     def merge(self, fdt_obj, replace: bool = True):
         """
@@ -245,8 +296,9 @@ class FDT:
         :param replace: True for replace existing items or False for keep old items
         """
         assert isinstance(fdt_obj, FDT)
+        self._check_mutable()
         if self.header.version is None:
-            self.header = fdt_obj.header
+            self.header = copy.copy(fdt_obj.header)
         else:
             if fdt_obj.header.version is not None and \
                fdt_obj.header.version > self.header.version:
@@ -264,14 +316,65 @@ class FDT:
 
         self.root.merge(fdt_obj.get_node('/'), replace)
 
+    def canonicalize(self):
+        """
+        Convert FDT Object into canonical form: memory reserve entries, nodes and properties are sorted and property
+        values are normalized to the type derived from their binary representation (as parse_dtb creates them).
+        """
+        self._check_mutable()
+        self.entries.sort(key=lambda e: (e['address'], e['size']))
+
+        def enter(node, path, depth):
+            for i, prop in enumerate(node.props):
+                if isinstance(prop, PropVariables):
+                    new_prop = PropVariables(prop.name, ' '.join(prop.data.split()))
+                else:
+                    new_prop = new_property(prop.name, get_raw_value(prop), trusted=True)
+                new_prop.set_parent(node)
+                node.props[i] = new_prop
+
+        traverse(self.root, enter)
+        self.root.sort()
+
+    def fingerprint(self, algo: str = 'sha256') -> str:
+        """
+        Get stable digest of FDT content (memory reserve entries and the tree, not the header). The digest is
+        calculated in one streaming pass over canonical form, so equal trees give equal fingerprints regardless
+        of nodes/properties order or value types.
+
+        :param algo: Hash algorithm name
+        """
+        hasher = hashlib.new(algo)
+        for entry in sorted((e['address'], e['size']) for e in self.entries):
+            hasher.update(pack('>BQQ', ord('M'), *entry))
+        stack = [(self.root, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                hasher.update(b'E')
+                continue
+            name = node.name.encode('ascii')
+            hasher.update(pack('>BI', ord('N'), len(name)) + name)
+            for prop in sorted(node.props, key=lambda p: p.name):
+                name = prop.name.encode('ascii')
+                if isinstance(prop, PropVariables):
+                    value = ' '.join(prop.data.split()).encode('ascii')
+                    marker = ord('V')
+                else:
+                    value = get_raw_value(prop)
+                    marker = ord('P')
+                hasher.update(pack('>BII', marker, len(name), len(value)) + name)
+                hasher.update(value)
+            stack.append((node, True))
+            stack.extend((sub, False) for sub in sorted(node.nodes, key=lambda n: n.name, reverse=True))
+        return hasher.hexdigest()
+
     def update_phandles(self):
-        all_nodes = []
+        self._check_mutable()
         phandle_value = 0
         no_phandle_nodes = []
 
-        node = self.root
-        all_nodes += self.root.nodes
-        while all_nodes:
+        for _, node in iter_nodes(self.root):
             props = (node.get_property('phandle'), node.get_property('linux,phandle'))
             value = None
             for i, p in enumerate(props):
@@ -281,9 +384,6 @@ class FDT:
                 no_phandle_nodes.append(node)
             elif phandle_value < value:
                 phandle_value = value
-            # ...
-            node = all_nodes.pop()
-            all_nodes += node.nodes
 
         if phandle_value > 0:
             phandle_value += 1
@@ -293,6 +393,49 @@ class FDT:
             node.set_property('phandle', phandle_value)
             phandle_value += 1
 
+    def to_dict(self) -> dict:
+        """ Convert FDT Object into dict with JSON compatible values """
+        data = {}
+        if self.header.version is not None:
+            data['version'] = self.header.version
+            data['last_comp_version'] = self.header.last_comp_version
+            data['boot_cpuid_phys'] = self.header.boot_cpuid_phys
+        data['memreserve'] = [[entry['address'], entry['size']] for entry in self.entries]
+        data['root'] = node_to_dict(self.root)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict, validate: bool = True):
+        """
+        Create FDT Object from dict (see to_dict). The tree is built without per-item checks
+
+        :param data: The dict
+        :param validate: If True, the created tree is validated in one pass at the end
+        """
+        fdt_obj = cls()
+        if data.get('version') is not None:
+            fdt_obj.header.version = data['version']
+            fdt_obj.header.last_comp_version = data.get('last_comp_version', data['version'] - 1)
+            fdt_obj.header.boot_cpuid_phys = data.get('boot_cpuid_phys', 0)
+        fdt_obj.entries = [{'address': address, 'size': size} for address, size in data.get('memreserve', [])]
+        fdt_obj.root = node_from_dict('/', data.get('root', {}))
+        if validate:
+            fdt_obj.validate()
+        return fdt_obj
+
+    def to_json(self, fp=None):
+        """
+        Store FDT Object in JSON format, streamed into file object if specified else returned as string
+
+        :param fp: The text file object
+        """
+        if fp is None:
+            from io import StringIO
+            fp = StringIO()
+            write_json(self, fp)
+            return fp.getvalue()
+        write_json(self, fp)
+
     def to_dts(self, tabsize: int = 4) -> str:
         """
         Store FDT Object into string format (DTS)
@@ -349,15 +492,15 @@ class FDT:
         if self.root is None:
             return b''
 
-        from struct import pack
-
+        # header of frozen tree is shared, the export is written into its copy
+        header = copy.copy(self.header)
         if version is not None:
-            self.header.version = version
+            header.version = version
         if last_comp_version is not None:
-            self.header.last_comp_version = last_comp_version
+            header.last_comp_version = last_comp_version
         if boot_cpuid_phys is not None:
-            self.header.boot_cpuid_phys = boot_cpuid_phys
-        if self.header.version is None:
+            header.boot_cpuid_phys = boot_cpuid_phys
+        if header.version is None:
             raise Exception("DTB Version must be specified !")
         if strings is None:
             strings = ''
@@ -367,16 +510,18 @@ class FDT:
             for entry in self.entries:
                 blob_entries += pack('>QQ', entry['address'], entry['size'])
         blob_entries += pack('>QQ', 0, 0)
-        blob_data_start = self.header.size + len(blob_entries)
-        (blob_data, blob_strings, data_pos) = self.root.to_dtb(strings, blob_data_start, self.header.version)
+        blob_data_start = header.size + len(blob_entries)
+        (blob_data, blob_strings, data_pos) = self.root.to_dtb(strings, blob_data_start, header.version)
         blob_data += pack('>I', DTB_END)
-        self.header.size_dt_strings = len(blob_strings)
-        self.header.size_dt_struct = len(blob_data)
-        self.header.off_mem_rsvmap = self.header.size
-        self.header.off_dt_struct = blob_data_start
-        self.header.off_dt_strings = blob_data_start + len(blob_data)
-        self.header.total_size = blob_data_start + len(blob_data) + len(blob_strings)
-        blob_header = self.header.export()
+        header.size_dt_strings = len(blob_strings)
+        header.size_dt_struct = len(blob_data)
+        header.off_mem_rsvmap = header.size
+        header.off_dt_struct = blob_data_start
+        header.off_dt_strings = blob_data_start + len(blob_data)
+        header.total_size = blob_data_start + len(blob_data) + len(blob_strings)
+        blob_header = header.export()
+        if not self.frozen:
+            self.header = header
         return blob_header + blob_entries + blob_data + blob_strings.encode('ascii')
 
 
@@ -460,17 +605,16 @@ def parse_dts(text: str, root_dir: str = '', is_only_diff: bool = False) -> FDT:
                         for prop in prop_value.split():
                             prop_obj.append(int(prop, 16))
                     elif prop_value.startswith('/incbin/'):
-                        prop_value = prop_value.replace('/incbin/("', '').replace('")', '')
+                        prop_value = prop_value.replace('/incbin/(', '').rstrip(')')
                         prop_value = prop_value.split(',')
-                        file_path  = os.path.join(root_dir, prop_value[0].strip())
-                        file_offset = int(prop_value.strip(), 0) if len(prop_value) > 1 else 0
-                        file_size = int(prop_value.strip(), 0) if len(prop_value) > 2 else 0
+                        file_path  = os.path.join(root_dir, prop_value[0].strip().strip('"'))
+                        file_offset = int(prop_value[1].strip(), 0) if len(prop_value) > 1 else 0
+                        file_size = int(prop_value[2].strip(), 0) if len(prop_value) > 2 else 0
                         if file_path is None or not os.path.exists(file_path):
                             raise Exception("File path doesn't exist: {}".format(file_path))
-                        with open(file_path, "rb") as f:
-                            f.seek(file_offset)
-                            prop_data = f.read(file_size) if file_size > 0 else f.read()
-                        prop_obj = PropIncBin(prop_name, prop_data, os.path.split(file_path)[1])
+                        # the data are loaded on demand
+                        prop_obj = PropIncBin(prop_name, file_name=os.path.split(file_path)[1], file_path=file_path,
+                                              offset=file_offset, size=file_size)
                     elif prop_value.startswith('/plugin/'):
                         raise NotImplementedError("Not implemented property value: /plugin/")
                     elif prop_value.startswith('/bits/'):
@@ -487,12 +631,29 @@ def parse_dts(text: str, root_dir: str = '', is_only_diff: bool = False) -> FDT:
     return fdt_obj
 
 
-def parse_dtb(data: bytes, offset: int = 0) -> FDT:
+def parse_json(text: str, validate: bool = True) -> FDT:
     """
-    Parse FDT Binary Blob and create FDT Object
+    Parse JSON text (see FDT.to_json) and create FDT Object
+
+    :param text: The JSON text
+    :param validate: If True, the created tree is validated in one pass at the end
+    """
+    try:
+        data = json.loads(text)
+    except RecursionError:
+        # json decoder is recursive, each node level nests two JSON objects
+        raise ValueError("JSON is nested too deeply, trees deeper than about {} levels can't be parsed".format(
+            sys.getrecursionlimit() // 2)) from None
+    return FDT.from_dict(data, validate)
+
+
+def parse_dtb(data: bytes, offset: int = 0, validate: bool = True) -> FDT:
+    """
+    Parse FDT Binary Blob and create FDT Object. The tree is built without per-item checks
     
     :param data: FDT Binary Blob in bytes
     :param offset: The offset of input data
+    :param validate: If True, the created tree is validated in one pass at the end
     """
     assert isinstance(data, (bytes, bytearray)), "Invalid argument type"
 
@@ -500,7 +661,7 @@ def parse_dtb(data: bytes, offset: int = 0) -> FDT:
 
     fdt_obj = FDT()
     # parse header
-    fdt_obj.header = Header.parse(data)
+    fdt_obj.header = Header.parse(data, offset)
     # parse entries
     index = fdt_obj.header.off_mem_rsvmap
     while True:
@@ -512,44 +673,61 @@ def parse_dtb(data: bytes, offset: int = 0) -> FDT:
     # parse nodes
     current_node = None
     fdt_obj.root = None
-    index = fdt_obj.header.off_dt_struct
-    while True:
-        if len(data) < (offset + index + 4):
-            raise Exception("Index out of range !")
-        tag = unpack_from(">I", data, offset + index)[0]
-        index += 4
+    strings = {}
+    for tag, _, info in iter_tags(data, fdt_obj.header, offset):
         if tag == DTB_BEGIN_NODE:
-            node_name = extract_string(data, offset + index)
-            index = ((index + len(node_name) + 4) & ~3)
-            if not node_name: node_name = '/'
-            new_node = Node(node_name)
+            new_node = build_node(info if info else '/')
             if fdt_obj.root is None:
                 fdt_obj.root = new_node
             if current_node is not None:
-                current_node.append(new_node)
+                attach(current_node, new_node)
             current_node = new_node
         elif tag == DTB_END_NODE:
             if current_node is not None:
                 current_node = current_node.parent
         elif tag == DTB_PROP:
-            prop_size, prop_string_pos, = unpack_from(">II", data, offset + index)
-            prop_start = index + 8
-            if fdt_obj.header.version < 16 and prop_size >= 8:
-                prop_start = ((prop_start + 7) & ~0x7)
-            prop_name = extract_string(data, fdt_obj.header.off_dt_strings + prop_string_pos)
+            prop_string_pos, prop_start, prop_size = info
+            prop_name = strings.get(prop_string_pos)
+            if prop_name is None:
+                prop_name = strings[prop_string_pos] = get_string(data, fdt_obj.header, prop_string_pos, offset)
             prop_raw_value = data[offset + prop_start : offset + prop_start + prop_size]
-            index = prop_start + prop_size
-            index = ((index + 3) & ~0x3)
             if current_node is not None:
-                current_node.append(new_property(prop_name, prop_raw_value))
-        elif tag == DTB_END:
-            break
-        else:
-            raise Exception("Unknown Tag: {}".format(tag))
+                attach(current_node, new_property(prop_name, prop_raw_value, trusted=True))
 
+    if validate and fdt_obj.root is not None:
+        fdt_obj.validate()
     return fdt_obj
 
 
+def optimize(fdt_obj: FDT, sort: bool = False, version: int = None) -> bytes:
+    """
+    Export FDT Object into size optimized Binary Blob: property names share suffixes in the strings block and
+    optionally properties and nodes are sorted by name for better compressibility.
+
+    :param fdt_obj: The object of FDT
+    :param sort: If True, sort properties and nodes (modifies the object)
+    :param version: DTB version
+    """
+    if sort:
+        fdt_obj.root.sort()
+    strings = build_strings(p.name for _, node in iter_nodes(fdt_obj.root) for p in node.props)
+    return fdt_obj.to_dtb(version, strings=strings)
+
+
+def optimize_dtb(data: bytes, sort: bool = False) -> tuple:
+    """
+    Optimize size of FDT Binary Blob (NOPs are removed, strings block is rebuilt with shared suffixes). Return
+    optimized blob and count of saved bytes.
+
+    :param data: FDT Binary Blob in bytes
+    :param sort: If True, sort properties and nodes
+    """
+    fdt_obj = parse_dtb(data)
+    total_size = fdt_obj.header.total_size
+    blob = optimize(fdt_obj, sort)
+    return blob, total_size - len(blob)
+
+
 def diff(fdt1: FDT, fdt2: FDT) -> tuple:
     """ 
     Compare two flattened device tree objects and return list of 3 objects (same in 1 and 2, specific for 1, specific for 2)
@@ -626,3 +804,119 @@ def diff(fdt1: FDT, fdt2: FDT) -> tuple:
                 fdt_b.add_item(prop_b.copy(), path)
 
     return fdt_same, fdt_a, fdt_b
+
+
+def build_index(fdt_obj: FDT) -> dict:
+    """
+    Index FDT object for repeated comparing. The keys are (path, name) tuples where name is None for node entries,
+    the values are property values in binary blob representation, so the index doesn't depend on input format.
+
+    :param fdt_obj: The object of FDT
+    """
+    assert isinstance(fdt_obj, FDT), "Invalid argument type"
+
+    index = {}
+    for path, nodes, props in fdt_obj.walk():
+        index[(path, None)] = None
+        for prop in props:
+            index[(path, prop.name)] = get_raw_value(prop)
+    return index
+
+
+def diff_with_index(base_index: dict, fdt_obj: FDT) -> dict:
+    """
+    Compare FDT object against indexed baseline and return dict of differences {(path, name): status}, where
+    status is '+' for added, '-' for removed and '~' for changed item. Items inside added or removed nodes are omitted.
+
+    :param base_index: The baseline index created by build_index()
+    :param fdt_obj: The object of FDT
+    """
+    obj_index = build_index(fdt_obj)
+    changes = {}
+
+    for key, value in obj_index.items():
+        if key not in base_index:
+            changes[key] = '+'
+        elif base_index[key] != value:
+            changes[key] = '~'
+    for key in base_index:
+        if key not in obj_index:
+            changes[key] = '-'
+
+    # collapse content of added and removed nodes into the node entry
+    moved = {path for (path, name), status in changes.items() if name is None}
+    if moved:
+        def is_collapsed(path, name):
+            if name is not None and path in moved:
+                return True
+            while path != '/':
+                path = path.rsplit('/', 1)[0] or '/'
+                if path in moved:
+                    return True
+            return False
+        changes = {key: status for key, status in changes.items() if not is_collapsed(*key)}
+
+    return changes
+
+
+def _prop_json(prop):
+    """ Get JSON compatible representation of property value """
+    if isinstance(prop, PropBytes):
+        return bytes(prop.data).hex()
+    if isinstance(prop, (PropWords, PropStrings)):
+        return list(prop.data)
+    if isinstance(prop, PropVariables):
+        return prop.data
+    return None
+
+
+def diff_events(fdt1: FDT, fdt2: FDT):
+    """
+    Compare two flattened device tree objects and yield change events as dicts with keys: 'action' ('added',
+    'removed' or 'changed'), 'type' ('node', 'prop' or 'memreserve'), 'path', 'name', 'old' and 'new' value.
+    Content of added or removed node is not reported separately.
+
+    :param fdt1: The object 1 of FDT
+    :param fdt2: The object 2 of FDT
+    """
+    assert isinstance(fdt1, FDT), "Invalid argument type"
+    assert isinstance(fdt2, FDT), "Invalid argument type"
+
+    def event(action, itype, path, name, old=None, new=None):
+        return {'action': action, 'type': itype, 'path': path, 'name': name, 'old': old, 'new': new}
+
+    entries_b = [(e['address'], e['size']) for e in fdt2.entries]
+    entries_a = [(e['address'], e['size']) for e in fdt1.entries]
+    for address, size in entries_a:
+        if (address, size) not in entries_b:
+            yield event('removed', 'memreserve', None, None, old=[address, size])
+    for address, size in entries_b:
+        if (address, size) not in entries_a:
+            yield event('added', 'memreserve', None, None, new=[address, size])
+
+    stack = [('/', fdt1.root, fdt2.root)]
+    while stack:
+        path, node_a, node_b = stack.pop()
+        props_b = {p.name: p for p in node_b.props}
+        for prop_a in node_a.props:
+            prop_b = props_b.pop(prop_a.name, None)
+            if prop_b is None:
+                yield event('removed', 'prop', path, prop_a.name, old=_prop_json(prop_a))
+            elif prop_a != prop_b:
+                yield event('changed', 'prop', path, prop_a.name, old=_prop_json(prop_a), new=_prop_json(prop_b))
+        for prop_b in props_b.values():
+            yield event('added', 'prop', path, prop_b.name, new=_prop_json(prop_b))
+
+        nodes_b = {n.name: n for n in node_b.nodes}
+        pairs = []
+        for sub_a in node_a.nodes:
+            sub_b = nodes_b.pop(sub_a.name, None)
+            sub_path = path.rstrip('/') + '/' + sub_a.name
+            if sub_b is None:
+                yield event('removed', 'node', sub_path, sub_a.name)
+            else:
+                pairs.append((sub_path, sub_a, sub_b))
+        for sub_b in nodes_b.values():
+            yield event('added', 'node', path.rstrip('/') + '/' + sub_b.name, sub_b.name)
+        # keep document order of sub-nodes
+        stack += reversed(pairs)
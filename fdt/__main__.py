@@ -16,46 +16,40 @@
 
 import os
 import sys
+import json
 import fdt
+import mmap
 import argparse
+from fdt.misc import open_file, strip_compression_ext
+from concurrent.futures import ProcessPoolExecutor
 
 
 ########################################################################################################################
 # Helper Functions
 ########################################################################################################################
-def parse_fdt(file_path: str, file_type: str, is_only_diff: bool = False):
+def parse_fdt(file_path: str, file_type: str, is_only_diff: bool = False, cached: bool = False):
     """
-    Parse *.dtb ot *.dts input file and return FDT object
+    Parse *.dtb ot *.dts input file (optionally gzip, xz or bz2 compressed) and return FDT object
 
     :param file_path: The path to input file
-    :param file_type: File type 'dtb', 'dts' or 'auto'
+    :param file_type: File type 'dtb', 'dts', 'json' or 'auto'
+    :param is_only_diff: Passed to parse_dts()
+    :param cached: If True, the tree is loaded through the tree cache and it is frozen (read-only)
     """
 
     if not os.path.exists(file_path):
         raise Exception('File doesnt exist: {}'.format(file_path))
 
-    if file_type == 'auto':
-        if file_path.endswith(".dtb"):
-            file_type = 'dtb'
-        elif file_path.endswith(".dts"):
-            file_type = 'dts'
-        else:
-            raise Exception('Not supported file extension: {}'.format(file_path))
-
-    if file_type == 'dtb':
-        with open(file_path, 'rb') as f:
-            obj = fdt.parse_dtb(f.read())
-    else:
-        with open(file_path, 'r') as f:
-            obj = fdt.parse_dts(f.read(), os.path.dirname(file_path), is_only_diff)
-
-    return obj
+    if cached:
+        return fdt.load(file_path, file_type, is_only_diff)
+    return fdt.parse_file(file_path, file_type, is_only_diff)
 
 
 ########################################################################################################################
 # Commands Functions
 ########################################################################################################################
-def pack(in_file: str, out_file: str, version: int, lc_version: int, cpu_id: int, update_phandles: bool):
+def pack(in_file: str, out_file: str, version: int, lc_version: int, cpu_id: int, update_phandles: bool,
+         optimize: bool = False, sort: bool = False):
     """
     The implementation of pack command.
 
@@ -65,6 +59,8 @@ def pack(in_file: str, out_file: str, version: int, lc_version: int, cpu_id: int
     :param lc_version: DTB Last Compatible Version
     :param cpu_id: Boot CPU ID
     :param update_phandles: If True phandles will be updated
+    :param optimize: If True the blob size will be optimized
+    :param sort: If True properties and nodes will be sorted (implies optimize)
     """
 
     if version is not None and version > fdt.Header.MAX_VERSION:
@@ -73,28 +69,47 @@ def pack(in_file: str, out_file: str, version: int, lc_version: int, cpu_id: int
     fdt_obj = parse_fdt(in_file, 'dts')
     if update_phandles:
         fdt_obj.update_phandles()
-    raw_data = fdt_obj.to_dtb(version, lc_version, cpu_id)
+    if optimize or sort:
+        # plain export differs only in strings block, where names are added in order of use (see to_dtb)
+        plain_strings = ''
+        for _, node in fdt.iter_nodes(fdt_obj.root):
+            for prop in node.props:
+                if plain_strings.find(prop.name + '\0') < 0:
+                    plain_strings += prop.name + '\0'
+        if lc_version is not None:
+            fdt_obj.header.last_comp_version = lc_version
+        if cpu_id is not None:
+            fdt_obj.header.boot_cpuid_phys = cpu_id
+        raw_data = fdt.optimize(fdt_obj, sort, version)
+        plain_size = len(raw_data) - fdt_obj.header.size_dt_strings + len(plain_strings)
+        print(" Optimized: {} bytes saved ({} -> {})".format(plain_size - len(raw_data), plain_size, len(raw_data)))
+    else:
+        raw_data = fdt_obj.to_dtb(version, lc_version, cpu_id)
 
-    with open(out_file, 'wb') as f:
+    with open_file(out_file, 'wb') as f:
         f.write(raw_data)
 
     print(" DTB saved as: {}".format(out_file))
 
 
-def unpack(in_file: str, out_file: str, tab_size):
+def unpack(in_file: str, out_file: str, tab_size, out_format: str = 'dts'):
     """
     The implementation of unpack command.
 
     :param in_file: Input File Path
     :param out_file: Output File Path
     :param tab_size: Tabulator size in count of spaces
+    :param out_format: Output format 'dts' or 'json'
     """
     fdt_obj = parse_fdt(in_file, 'dtb')
 
-    with open(out_file, 'w') as f:
-        f.write(fdt_obj.to_dts(tab_size))
+    with open_file(out_file, 'w') as f:
+        if out_format == 'json':
+            fdt_obj.to_json(f)
+        else:
+            f.write(fdt_obj.to_dts(tab_size))
 
-    print(" DTS saved as: {}".format(out_file))
+    print(" {} saved as: {}".format(out_format.upper(), out_file))
 
 
 def merge(out_file: str, in_files: list, file_type: str, tab_size: int):
@@ -109,30 +124,43 @@ def merge(out_file: str, in_files: list, file_type: str, tab_size: int):
     fdt_obj = None
 
     for file in in_files:
-        obj = parse_fdt(file, file_type)
+        obj = parse_fdt(file, file_type, cached=True)
         if fdt_obj is None:
-            fdt_obj = obj
+            fdt_obj = obj.copy()
         else:
             fdt_obj.merge(obj)
 
-    with open(out_file, 'w') as f:
+    with open_file(out_file, 'w') as f:
         f.write(fdt_obj.to_dts(tab_size))
 
     print(" Output saved as: {}".format(out_file))
 
 
-def diff(in_file1: str, in_file2: str, file_type: str, out_dir: str):
+def diff(in_file1: str, in_file2: str, file_type: str, out_dir: str, out_format: str = 'dts'):
     """
     The implementation of diff command.
 
     :param in_file1: Input File1 Path
     :param in_file2: Input File2 Path
     :param file_type: The type of input files
-    :param out_dir: Path to output directory
+    :param out_dir: Path to output directory, for 'jsonl' format None means stdout
+    :param out_format: Output format 'dts' or 'jsonl'
     """
     # load input files
-    fdt1 = parse_fdt(in_file1, file_type, True)
-    fdt2 = parse_fdt(in_file2, file_type, True)
+    fdt1 = parse_fdt(in_file1, file_type, True, cached=True)
+    fdt2 = parse_fdt(in_file2, file_type, True, cached=True)
+
+    if out_format == 'jsonl':
+        if out_dir is None:
+            for event in fdt.diff_events(fdt1, fdt2):
+                print(json.dumps(event))
+        else:
+            os.makedirs(out_dir, exist_ok=True)
+            with open(os.path.join(out_dir, 'diff.jsonl'), 'w') as f:
+                for event in fdt.diff_events(fdt1, fdt2):
+                    f.write(json.dumps(event) + '\n')
+            print(" Diff output saved into: {}".format(out_dir))
+        return
 
     # compare it
     diff = fdt.diff(fdt1, fdt2)
@@ -146,8 +174,8 @@ def diff(in_file1: str, in_file2: str, file_type: str, out_dir: str):
     # get names for output files
     file_name = (
         "same.dts",
-        os.path.splitext(os.path.basename(in_file1))[0] + ".dts",
-        os.path.splitext(os.path.basename(in_file2))[0] + ".dts")
+        os.path.splitext(os.path.basename(strip_compression_ext(in_file1)))[0] + ".dts",
+        os.path.splitext(os.path.basename(strip_compression_ext(in_file2)))[0] + ".dts")
 
     # save output files
     for index, obj in enumerate(diff):
@@ -158,6 +186,181 @@ def diff(in_file1: str, in_file2: str, file_type: str, out_dir: str):
     print(" Diff output saved into: {}".format(out_dir))
 
 
+def extract(in_file: str, out_file: str, node_path: str):
+    """
+    The implementation of extract command.
+
+    :param in_file: Input File Path
+    :param out_file: Output File Path
+    :param node_path: The path to sub-tree node
+    """
+    with open_file(in_file, 'rb') as f:
+        raw_data = fdt.extract(f.read(), node_path)
+
+    with open_file(out_file, 'wb') as f:
+        f.write(raw_data)
+
+    print(" DTB saved as: {}".format(out_file))
+
+
+def fit(in_file: str, verify: bool, image_name: str, out_file: str):
+    """
+    The implementation of fit command.
+
+    :param in_file: Input FIT File Path
+    :param verify: If True the hashes of images will be verified
+    :param image_name: The name of image to extract or None
+    :param out_file: Output File Path
+    """
+    with fdt.FitImage(in_file) as fit_obj:
+        if image_name is not None:
+            if image_name not in fit_obj.images:
+                raise Exception("Image \"{}\" doesn't exists".format(image_name))
+            fit_obj.images[image_name].extract(out_file)
+            print(" Image saved as: {}".format(out_file))
+            return
+
+        print(" Images:")
+        for entry in fit_obj.images.values():
+            status = ''
+            if verify:
+                status = ' [OK]' if entry.verify() else ' [FAILED]'
+            print("  {}{}".format(entry, status))
+        print(" Configurations (default: {}):".format(fit_obj.default_configuration))
+        for config in fit_obj.configurations.values():
+            print("  {}".format(config))
+
+
+def _scan_parse(file_path: str, offset: int, size: int):
+    """ Worker job, parse blob found at offset and return (offset, error or None, description) """
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            fdt_obj = fdt.parse_dtb(data[offset:offset + size])
+        except Exception as e:
+            return offset, str(e) or "Unknown Error", None
+    model = fdt_obj.root.get_property('model')
+    compatible = fdt_obj.root.get_property('compatible')
+    items = fdt_obj.search('')
+    desc = "{} nodes, {} props".format(sum(isinstance(i, fdt.Node) for i in items),
+                                        sum(not isinstance(i, fdt.Node) for i in items))
+    if model is not None:
+        desc += ", model: {}".format(model.value)
+    if compatible is not None:
+        desc += ", compatible: {}".format(compatible.value)
+    return offset, None, desc
+
+
+def scan(in_file: str, out_dir: str, jobs: int):
+    """
+    The implementation of scan command.
+
+    :param in_file: Input File Path (any binary image)
+    :param out_dir: Path to output directory for extracted blobs or None
+    :param jobs: Count of worker processes
+    """
+    with open(in_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        candidates = [(offset, header.total_size) for offset, header in fdt.scan(data)]
+        if not candidates:
+            print(" No device tree blob found")
+            return
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_scan_parse, [in_file] * len(candidates),
+                                        [offset for offset, _ in candidates], [size for _, size in candidates]))
+
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+        file_name = os.path.splitext(os.path.basename(in_file))[0]
+        sizes = dict(candidates)
+        for offset, error, desc in results:
+            if error is not None:
+                print(" 0x{:08X}: {} bytes, invalid ({})".format(offset, sizes[offset], error))
+                continue
+            print(" 0x{:08X}: {} bytes, {}".format(offset, sizes[offset], desc))
+            if out_dir is not None:
+                out_file = os.path.join(out_dir, "{}-0x{:08X}.dtb".format(file_name, offset))
+                with open(out_file, 'wb') as f_out:
+                    f_out.write(data[offset:offset + sizes[offset]])
+                print("   saved as: {}".format(out_file))
+
+
+def fingerprint(in_files: list, file_type: str):
+    """
+    The implementation of fingerprint command.
+
+    :param in_files: Input Files Path
+    :param file_type: The type of input files
+    """
+    for file in in_files:
+        print("{}  {}".format(parse_fdt(file, file_type, cached=True).fingerprint(), file))
+
+
+_fleet_base_index = None
+
+
+def _fleet_init(base_index: dict, cache_dir: str):
+    """ Worker initializer, keep the baseline index per process """
+    global _fleet_base_index
+    _fleet_base_index = base_index
+    fdt.set_cache_dir(cache_dir)
+
+
+def _fleet_diff(file_path: str, file_type: str):
+    """ Worker job, parse one board file and compare it against the baseline index """
+    return file_path, fdt.diff_with_index(_fleet_base_index, parse_fdt(file_path, file_type, cached=True))
+
+
+def fleet(base_file: str, in_files: list, file_type: str, out_file: str, jobs: int):
+    """
+    The implementation of fleet command.
+
+    :param base_file: Baseline File Path
+    :param in_files: Board Files Path
+    :param file_type: The type of input files
+    :param out_file: Output CSV File Path or None for stdout
+    :param jobs: Count of worker processes
+    """
+    # boards are named by paths relative to their common directory, so equal file names are distinguished
+    abs_paths = [os.path.abspath(file_path) for file_path in in_files]
+    for i, file_path in enumerate(abs_paths):
+        if file_path in abs_paths[:i]:
+            raise Exception('Board file specified more than once: {}'.format(in_files[i]))
+    common_dir = os.path.commonpath([os.path.dirname(file_path) for file_path in abs_paths])
+    names = [os.path.relpath(file_path, common_dir) for file_path in abs_paths]
+
+    base_index = fdt.build_index(parse_fdt(base_file, file_type, cached=True))
+    disk = fdt.cache.default_cache.disk
+
+    # compare all boards against the baseline in worker pool
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_fleet_init,
+                             initargs=(base_index, disk.cache_dir if disk is not None else None)) as executor:
+        for file_path, changes in executor.map(_fleet_diff, in_files, [file_type] * len(in_files),
+                                               chunksize=max(1, len(in_files) // (4 * (jobs or os.cpu_count() or 1)))):
+            results[file_path] = changes
+
+    # build matrix: one row per differing path/property, one column per board
+    rows = sorted({key for changes in results.values() for key in changes}, key=lambda k: (k[0], k[1] or ''))
+
+    if out_file is None:
+        width = max([len(name) for name in names] + [1])
+        print("{} {}".format(' '.join(name.rjust(width) for name in names), 'path'))
+        for path, name in rows:
+            cells = [results[file_path].get((path, name), '.') for file_path in in_files]
+            item = path if name is None else "{}:{}".format(path, name)
+            print("{} {}".format(' '.join(cell.rjust(width) for cell in cells), item))
+    else:
+        import csv
+        with open(out_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'property'] + names)
+            for path, name in rows:
+                writer.writerow([path, name or ''] + [results[file_path].get((path, name), '') for file_path in in_files])
+        print(" Fleet diff saved as: {}".format(out_file))
+
+    print(" {} boards compared, {} differing items".format(len(in_files), len(rows)), file=sys.stderr)
+
+
 ########################################################################################################################
 # Main
 ########################################################################################################################
@@ -167,6 +370,8 @@ def main():
         prog="pydtc",
         description="Flat Device Tree (FDT) tool for manipulation with *.dtb and *.dts files")
     parser.add_argument('-v', '--version', action='version', version=fdt.__version__)
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=os.environ.get('PYDTC_CACHE_DIR'),
+                        help='Directory of persistent parse cache (default: $PYDTC_CACHE_DIR, disabled if not set)')
     subparsers = parser.add_subparsers(dest='command')
 
     # pack command
@@ -177,52 +382,122 @@ def main():
     pack_parser.add_argument('-c', dest='cpu_id', type=int, help='Boot CPU ID')
     pack_parser.add_argument('-p', dest='phandles', action='store_true', help='Update phandles')
     pack_parser.add_argument('-o', dest='dtb_file', type=str, help='Output path with file name (*.dtb)')
+    pack_parser.add_argument('--optimize', dest='optimize', action='store_true',
+                             help='Optimize blob size (shared suffixes in strings block)')
+    pack_parser.add_argument('--sort', dest='sort', action='store_true',
+                             help='Sort properties and nodes by name (implies --optimize)')
 
     # unpack command
     unpack_parser = subparsers.add_parser('unpack', help='Unpack *.dtb into readable format (*.dts)')
     unpack_parser.add_argument('dtb_file', nargs=1, help='Path to *.dtb file')
     unpack_parser.add_argument('-s', dest='tab_size', type=int, default=4, help='Tabulator Size')
     unpack_parser.add_argument('-o', dest='dts_file', type=str, help='Output path with file name (*.dts)')
+    unpack_parser.add_argument('-f', '--format', dest='format', type=str, default='dts', choices=['dts', 'json'],
+                               help='Output format')
 
     # merge command
     merge_parser = subparsers.add_parser('merge', help='Merge more files in *.dtb or *.dts format')
     merge_parser.add_argument('out_file', nargs=1, help='Output path with file name (*.dts or *.dtb)')
     merge_parser.add_argument('in_files', nargs='+', help='Path to input files')
-    merge_parser.add_argument('-t', dest='type', type=str, choices=['auto', 'dts', 'dtb'], help='Input file type')
+    merge_parser.add_argument('-t', dest='type', type=str, choices=['auto', 'dts', 'dtb', 'json'], help='Input file type')
     merge_parser.add_argument('-s', dest='tab_size', type=int, default=4, help='Tabulator Size for dts')
 
     # diff command
     diff_parser = subparsers.add_parser('diff', help='Compare two files in *.dtb or *.dts format')
     diff_parser.add_argument('in_file1', nargs=1, help='Path to dts or dtb file')
     diff_parser.add_argument('in_file2', nargs=1, help='Path to dts or dtb file')
-    diff_parser.add_argument('-t', dest='type', type=str, choices=['auto', 'dts', 'dtb'], help='Input file type')
+    diff_parser.add_argument('-t', dest='type', type=str, choices=['auto', 'dts', 'dtb', 'json'], help='Input file type')
     diff_parser.add_argument('-o', dest='out_dir', type=str, help='Output directory')
+    diff_parser.add_argument('-f', '--format', dest='format', type=str, default='dts', choices=['dts', 'jsonl'],
+                             help='Output format (jsonl is printed to stdout if output directory is not set)')
+
+    # extract command
+    extract_parser = subparsers.add_parser('extract', help='Extract sub-tree of *.dtb into standalone *.dtb')
+    extract_parser.add_argument('dtb_file', nargs=1, help='Path to *.dtb file')
+    extract_parser.add_argument('node_path', nargs=1, help='Path to sub-tree node (e.g. /chosen)')
+    extract_parser.add_argument('-o', dest='out_file', type=str, help='Output path with file name (*.dtb)')
+
+    # fit command
+    fit_parser = subparsers.add_parser('fit', help='Show, verify or extract images of FIT image (*.itb)')
+    fit_parser.add_argument('itb_file', nargs=1, help='Path to *.itb file')
+    fit_parser.add_argument('--verify', dest='verify', action='store_true', help='Verify image hashes')
+    fit_parser.add_argument('-x', dest='image', type=str, help='Name of image to extract')
+    fit_parser.add_argument('-o', dest='out_file', type=str, help='Output path with file name for extracted image')
+
+    # scan command
+    scan_parser = subparsers.add_parser('scan', help='Find device tree blobs embedded in binary image')
+    scan_parser.add_argument('in_file', nargs=1, help='Path to binary image')
+    scan_parser.add_argument('-j', dest='jobs', type=int, help='Count of worker processes (default: CPU count)')
+    scan_parser.add_argument('-x', dest='out_dir', type=str, help='Extract found blobs into output directory')
+
+    # fingerprint command
+    fingerprint_parser = subparsers.add_parser('fingerprint', help='Print stable digest of content of *.dtb or *.dts files')
+    fingerprint_parser.add_argument('in_files', nargs='+', help='Path to input files')
+    fingerprint_parser.add_argument('-t', dest='type', type=str, default='auto', choices=['auto', 'dts', 'dtb', 'json'],
+                                    help='Input file type')
+
+    # fleet command
+    fleet_parser = subparsers.add_parser('fleet', help='Compare many files in *.dtb or *.dts format against baseline')
+    fleet_parser.add_argument('base_file', nargs=1, help='Path to baseline dts or dtb file')
+    fleet_parser.add_argument('in_files', nargs='+', help='Path to board dts or dtb files')
+    fleet_parser.add_argument('-t', dest='type', type=str, default='auto', choices=['auto', 'dts', 'dtb', 'json'],
+                              help='Input file type')
+    fleet_parser.add_argument('-j', dest='jobs', type=int, help='Count of worker processes (default: CPU count)')
+    fleet_parser.add_argument('-o', dest='out_file', type=str, help='Output path with file name (*.csv)')
 
     args = parser.parse_args()
 
     try:
+        if args.cache_dir:
+            fdt.set_cache_dir(args.cache_dir)
+
         if args.command == 'pack':
             in_file = args.dts_file[0]
             if args.dtb_file is None:
-                out_file = os.path.splitext(os.path.basename(in_file))[0] + ".dtb"
+                out_file = os.path.splitext(os.path.basename(strip_compression_ext(in_file)))[0] + ".dtb"
             else:
                 out_file = args.dtb_file.lstrip()
-            pack(in_file, out_file, args.version, args.lc_version, args.cpu_id, args.phandles)
+            pack(in_file, out_file, args.version, args.lc_version, args.cpu_id, args.phandles, args.optimize, args.sort)
 
         elif args.command == 'unpack':
             in_file = args.dtb_file[0]
             if args.dts_file is None:
-                out_file = os.path.splitext(os.path.basename(in_file))[0] + ".dts"
+                out_file = os.path.splitext(os.path.basename(strip_compression_ext(in_file)))[0] + "." + args.format
             else:
                 out_file = args.dts_file.lstrip()
-            unpack(in_file, out_file, args.tab_size)
+            unpack(in_file, out_file, args.tab_size, args.format)
 
         elif args.command == 'merge':
             merge(args.out_file[0], args.in_files, args.type, args.tab_size)
 
         elif args.command == 'diff':
-            out_dir = args.out_dir if args.out_dir else os.path.join(os.getcwd(), 'diff_out')
-            diff(args.in_file1[0], args.in_file2[0], args.type, out_dir.lstrip())
+            if args.format == 'jsonl':
+                out_dir = args.out_dir.lstrip() if args.out_dir else None
+            else:
+                out_dir = args.out_dir.lstrip() if args.out_dir else os.path.join(os.getcwd(), 'diff_out')
+            diff(args.in_file1[0], args.in_file2[0], args.type, out_dir, args.format)
+
+        elif args.command == 'extract':
+            in_file = args.dtb_file[0]
+            if args.out_file is None:
+                node_name = args.node_path[0].strip('/').split('/')[-1] or 'root'
+                out_file = os.path.splitext(os.path.basename(strip_compression_ext(in_file)))[0] + "-" + node_name + ".dtb"
+            else:
+                out_file = args.out_file.lstrip()
+            extract(in_file, out_file, args.node_path[0])
+
+        elif args.command == 'fit':
+            out_file = args.out_file.lstrip() if args.out_file else "{}.bin".format(args.image)
+            fit(args.itb_file[0], args.verify, args.image, out_file)
+
+        elif args.command == 'scan':
+            scan(args.in_file[0], args.out_dir.lstrip() if args.out_dir else None, args.jobs)
+
+        elif args.command == 'fingerprint':
+            fingerprint(args.in_files, args.type)
+
+        elif args.command == 'fleet':
+            fleet(args.base_file[0], args.in_files, args.type, args.out_file, args.jobs)
 
         else:
             parser.print_help()
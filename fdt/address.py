@@ -0,0 +1,273 @@
+# Copyright 2017 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from bisect import bisect_right
+
+from .items import Property, PropWords, traverse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_ADDRESS_CELLS = 2
+DEFAULT_SIZE_CELLS = 1
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def _u64_array(values=()):
+    """ Create packed array of 64-bit unsigned values (NumPy if available) """
+    if numpy is not None:
+        return numpy.array(values, dtype=numpy.uint64)
+    return array('Q', values)
+
+
+def _cells_value(node, name: str, default: int) -> int:
+    prop = node.get_property(name)
+    return prop.value if isinstance(prop, PropWords) and prop.value is not None else default
+
+
+def _decode_words(words: list, cells: tuple) -> list:
+    """
+    Decode flat list of words into columns with 64-bit values. Only the lowest two words of every value are used,
+    higher words (e.g. PCI flags) are ignored.
+
+    :param words: List of 32-bit words
+    :param cells: Count of words for each column, e.g. (address_cells, size_cells)
+    """
+    width = sum(cells)
+    count = len(words) // width if width else 0
+    columns = []
+    if numpy is not None:
+        table = numpy.array(words[:count * width], dtype=numpy.uint64).reshape(count, width)
+        offset = 0
+        for ncells in cells:
+            value = numpy.zeros(count, dtype=numpy.uint64)
+            for i in range(max(offset, offset + ncells - 2), offset + ncells):
+                value = (value << numpy.uint64(32)) | table[:, i]
+            columns.append(value)
+            offset += ncells
+    else:
+        offset = 0
+        for ncells in cells:
+            value = array('Q', bytes(8 * count))
+            for row in range(count):
+                base = row * width + offset
+                for i in range(max(base, base + ncells - 2), base + ncells):
+                    value[row] = (value[row] << 32) | words[i]
+            columns.append(value)
+            offset += ncells
+    return columns
+
+
+def _translate(addresses, translation):
+    """
+    Translate child bus addresses into CPU addresses. Return translated addresses and mask of translated items.
+
+    :param addresses: The array of child bus addresses
+    :param translation: List of (child_base, cpu_base, size) tuples, None for untranslatable bus or True for identity
+    """
+    if translation is True:
+        return addresses, [True] * len(addresses)
+    if not translation:
+        return addresses, [False] * len(addresses)
+    if numpy is not None:
+        result = addresses.copy()
+        done = numpy.zeros(len(addresses), dtype=bool)
+        for child_base, cpu_base, size in translation:
+            mask = ~done & (addresses >= numpy.uint64(child_base)) & \
+                   (addresses - numpy.uint64(child_base) < numpy.uint64(size))
+            result[mask] = addresses[mask] - numpy.uint64(child_base) + numpy.uint64(cpu_base)
+            done |= mask
+        return result, done.tolist()
+    result = array('Q', addresses)
+    done = [False] * len(addresses)
+    for i, address in enumerate(addresses):
+        for child_base, cpu_base, size in translation:
+            if child_base <= address < child_base + size:
+                result[i] = (address - child_base + cpu_base) & 0xFFFFFFFFFFFFFFFF
+                done[i] = True
+                break
+    return result, done
+
+
+def _concat(chunks):
+    if numpy is not None:
+        return numpy.concatenate(chunks) if chunks else _u64_array()
+    result = array('Q')
+    for chunk in chunks:
+        result.extend(chunk)
+    return result
+
+
+########################################################################################################################
+# Address Map Class
+########################################################################################################################
+
+class AddressMap:
+    """ Decoded 'reg' regions of all nodes, translated through parent 'ranges' into CPU address space """
+
+    def __init__(self, fdt_obj):
+        """
+        AddressMap constructor
+
+        :param fdt_obj: The object of FDT
+        """
+        # node paths and per-region arrays
+        self.paths = []
+        self.owner = array('L')
+        self.start = _u64_array()
+        self.size = _u64_array()
+        self.translated = []
+        # per-bus translations (child_base, cpu_base, size) of decoded 'ranges'
+        self.ranges = {}
+
+        buses = {}
+        stack = []
+        bus_counter = [0]
+
+        def enter(node, path, depth):
+            if not stack:
+                # root node: CPU address space
+                stack.append((_cells_value(node, '#address-cells', DEFAULT_ADDRESS_CELLS),
+                              _cells_value(node, '#size-cells', DEFAULT_SIZE_CELLS), True, 0))
+                return
+            address_cells, size_cells, translation, bus_id = stack[-1]
+            node_address_cells = _cells_value(node, '#address-cells', DEFAULT_ADDRESS_CELLS)
+            node_size_cells = _cells_value(node, '#size-cells', DEFAULT_SIZE_CELLS)
+
+            reg = node.get_property('reg')
+            if isinstance(reg, PropWords) and reg.data:
+                index = len(self.paths)
+                self.paths.append(path)
+                key = (address_cells, size_cells, bus_id)
+                if key not in buses:
+                    buses[key] = (translation, [], array('L'))
+                words, owners = buses[key][1], buses[key][2]
+                count = len(reg.data) // (address_cells + size_cells) if address_cells + size_cells else 0
+                words += reg.data[:count * (address_cells + size_cells)]
+                owners.extend([index] * count)
+
+            # translation for children of this node
+            ranges = node.get_property('ranges')
+            if isinstance(ranges, PropWords) and ranges.data:
+                child, parent, size = _decode_words(ranges.data, (node_address_cells, address_cells, node_size_cells))
+                cpu, done = _translate(parent, translation)
+                child_translation = [(int(c), int(p), int(s)) for c, p, s, d in zip(child, cpu, size, done) if d]
+                self.ranges[path] = child_translation
+            elif type(ranges) is Property:
+                # empty 'ranges' means identity mapping
+                child_translation = translation
+            else:
+                child_translation = None
+            bus_counter[0] += 1
+            stack.append((node_address_cells, node_size_cells, child_translation, bus_counter[0]))
+
+        def leave(node, path, depth):
+            stack.pop()
+
+        traverse(fdt_obj.root, enter, leave, '/')
+
+        # decode all regions of each bus at once
+        starts, sizes = [], []
+        for (address_cells, size_cells, _), (translation, words, owners) in buses.items():
+            start, size = _decode_words(words, (address_cells, size_cells))
+            start, done = _translate(start, translation)
+            starts.append(start)
+            sizes.append(size)
+            self.owner.extend(owners)
+            self.translated += done
+        self.start = _concat(starts)
+        self.size = _concat(sizes)
+
+    def __len__(self):
+        """ Get count of regions """
+        return len(self.owner)
+
+    def regions(self, path: str) -> list:
+        """
+        Get list of (start, size) regions of node
+
+        :param path: The node path
+        """
+        return [(int(self.start[i]), int(self.size[i])) for i in range(len(self.owner))
+                if self.paths[self.owner[i]] == path]
+
+    def index(self):
+        """ Create IntervalIndex over all translated regions """
+        select = [i for i, done in enumerate(self.translated) if done]
+        return IntervalIndex([self.start[i] for i in select], [self.size[i] for i in select],
+                             [self.paths[self.owner[i]] for i in select])
+
+
+########################################################################################################################
+# Interval Index Class
+########################################################################################################################
+
+class IntervalIndex:
+    """ Sorted index of address intervals for ownership and overlap queries """
+
+    def __init__(self, starts, sizes, owners: list):
+        """
+        IntervalIndex constructor
+
+        :param starts: Start addresses
+        :param sizes: Sizes of intervals
+        :param owners: Owner of every interval (e.g. node path)
+        """
+        order = sorted(range(len(owners)), key=lambda i: int(starts[i]))
+        self.starts = [int(starts[i]) for i in order]
+        self.ends = [int(starts[i]) + int(sizes[i]) for i in order]
+        self.owners = [owners[i] for i in order]
+        # running maximum of interval ends, bounds the backward scan in queries
+        self._max_ends = []
+        max_end = 0
+        for end in self.ends:
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.owners)
+
+    def find(self, address: int) -> list:
+        """
+        Get owners of all intervals containing address
+
+        :param address: The address
+        """
+        result = []
+        i = bisect_right(self.starts, address) - 1
+        while i >= 0 and self._max_ends[i] > address:
+            if self.ends[i] > address:
+                result.append(self.owners[i])
+            i -= 1
+        result.reverse()
+        return result
+
+    def overlaps(self) -> list:
+        """ Get list of (owner1, owner2, start, end) tuples for all overlapping intervals """
+        result = []
+        for i in range(1, len(self.starts)):
+            if self.starts[i] >= self._max_ends[i - 1]:
+                continue
+            j = i - 1
+            while j >= 0 and self._max_ends[j] > self.starts[i]:
+                if self.ends[j] > self.starts[i] and self.ends[i] > self.starts[i]:
+                    result.append((self.owners[j], self.owners[i], self.starts[i], min(self.ends[i], self.ends[j])))
+                j -= 1
+        return result
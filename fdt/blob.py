@@ -0,0 +1,199 @@
+# Copyright 2017 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from struct import pack, pack_into, unpack_from
+
+from .header import Header, DTB_BEGIN_NODE, DTB_END_NODE, DTB_PROP, DTB_END, DTB_NOP
+
+
+########################################################################################################################
+# Struct Block Scanner
+########################################################################################################################
+
+def iter_tags(data, header: Header, offset: int = 0):
+    """
+    Scan struct block of binary blob and yield (tag, position, info) tuples, where position is the tag position
+    relative to blob start and info is the node name for DTB_BEGIN_NODE, (string offset, value position, value size)
+    for DTB_PROP and None for other tags. The scan ends with DTB_END tag.
+
+    :param data: FDT Binary Blob in bytes
+    :param header: Parsed header of blob
+    :param offset: The offset of blob in data
+    """
+    index = header.off_dt_struct
+    while True:
+        if len(data) < (offset + index + 4):
+            raise Exception("Index out of range !")
+        position = index
+        tag = unpack_from(">I", data, offset + index)[0]
+        index += 4
+        if tag == DTB_BEGIN_NODE:
+            name_end = data.find(b'\0', offset + index)
+            if name_end < 0:
+                raise Exception("Index out of range !")
+            node_name = bytes(data[offset + index:name_end]).decode('ascii')
+            index = ((index + len(node_name) + 4) & ~3)
+            yield tag, position, node_name
+        elif tag == DTB_PROP:
+            prop_size, prop_string_pos, = unpack_from(">II", data, offset + index)
+            prop_start = index + 8
+            if header.version < 16 and prop_size >= 8:
+                prop_start = ((prop_start + 7) & ~0x7)
+            index = ((prop_start + prop_size + 3) & ~0x3)
+            yield tag, position, (prop_string_pos, prop_start, prop_size)
+        elif tag in (DTB_END_NODE, DTB_NOP):
+            yield tag, position, None
+        elif tag == DTB_END:
+            yield tag, position, None
+            break
+        else:
+            raise Exception("Unknown Tag: {}".format(tag))
+
+
+def get_string(data, header: Header, string_pos: int, offset: int = 0) -> str:
+    """
+    Get string from strings block of binary blob
+
+    :param data: FDT Binary Blob in bytes
+    :param header: Parsed header of blob
+    :param string_pos: The string offset in strings block
+    :param offset: The offset of blob in data
+    """
+    start = offset + header.off_dt_strings + string_pos
+    return bytes(data[start:data.find(b'\0', start)]).decode('ascii')
+
+
+def build_strings(names) -> str:
+    """
+    Build strings block content where names which are suffix of other name share its bytes
+
+    :param names: Property names
+    """
+    rnames = sorted({name[::-1] for name in names})
+    # name is suffix of the following one in sorted order of reversed names
+    kept = [rname[::-1] for i, rname in enumerate(rnames) if i + 1 == len(rnames) or not rnames[i + 1].startswith(rname)]
+    return ''.join(name + '\0' for name in kept)
+
+
+########################################################################################################################
+# Raw Blob Operations
+########################################################################################################################
+
+def scan(data, start: int = 0, end: int = None):
+    """
+    Find FDT Binary Blobs embedded in data (e.g. firmware image) and yield (offset, header) tuples of candidates
+    which passed the header bounds checks.
+
+    :param data: The data (bytes, bytearray or mmap)
+    :param start: The offset where scanning starts
+    :param end: The offset where scanning ends (default: end of data)
+    """
+    magic = pack('>I', Header.MAGIC_NUMBER)
+    end = len(data) if end is None else min(end, len(data))
+    offset = data.find(magic, start, end)
+    while offset >= 0:
+        try:
+            header = Header.parse(data, offset)
+        except Exception:
+            header = None
+        if header is not None and _check_bounds(header, len(data) - offset):
+            yield offset, header
+        offset = data.find(magic, offset + 4, end)
+
+
+def _check_bounds(header: Header, max_size: int) -> bool:
+    """ Check if header values describe consistent blob which fits into max_size """
+    if not 1 <= header.version <= Header.MAX_VERSION or header.last_comp_version > header.version:
+        return False
+    if not header.size <= header.total_size <= max_size:
+        return False
+    for block_offset in (header.off_mem_rsvmap, header.off_dt_struct, header.off_dt_strings):
+        if not header.size <= block_offset <= header.total_size:
+            return False
+    if header.off_dt_struct % 4 or header.off_mem_rsvmap % 8:
+        return False
+    if header.size_dt_strings is not None and header.off_dt_strings + header.size_dt_strings > header.total_size:
+        return False
+    if header.size_dt_struct is not None and header.off_dt_struct + header.size_dt_struct > header.total_size:
+        return False
+    return True
+
+
+def extract(data, path: str, offset: int = 0) -> bytes:
+    """
+    Extract sub-tree from binary blob as standalone binary blob without parsing the whole tree. The raw struct
+    bytes of the sub-tree are copied and only the strings block is rebuilt.
+
+    :param data: FDT Binary Blob in bytes
+    :param path: The path to sub-tree node
+    :param offset: The offset of blob in data
+    """
+    header = Header.parse(data, offset)
+    if header.version < 16:
+        # old versions align property values to absolute position, the raw copy can't be relocated
+        from . import parse_dtb, FDT
+        fdt_obj = parse_dtb(bytes(data[offset:offset + header.total_size]))
+        new_obj = FDT()
+        new_obj.root = fdt_obj.get_node(path).copy()
+        new_obj.root.set_name('/')
+        return new_obj.to_dtb(version=Header.MAX_VERSION, boot_cpuid_phys=header.boot_cpuid_phys)
+
+    names = [name for name in path.split('/') if name]
+    stack = []
+    body_start = None
+    props = []
+    for tag, position, info in iter_tags(data, header, offset):
+        if body_start is None:
+            if tag == DTB_BEGIN_NODE:
+                stack.append(info)
+                # the first (root) node name is empty
+                if stack[1:] == names:
+                    body_start = position + 4 + ((len(info) + 4) & ~3)
+                    depth = len(stack)
+            elif tag == DTB_END_NODE:
+                stack.pop()
+            elif tag == DTB_END:
+                raise ValueError("Path \"{}\" doesn't exists".format(path))
+        else:
+            if tag == DTB_BEGIN_NODE:
+                stack.append(info)
+            elif tag == DTB_END_NODE:
+                stack.pop()
+                if len(stack) < depth:
+                    body_end = position + 4
+                    break
+            elif tag == DTB_PROP:
+                props.append((position + 8 - body_start, info[0]))
+
+    # rebuild strings block and patch name offsets in copied struct data
+    body = bytearray(data[offset + body_start:offset + body_end])
+    strings = bytearray()
+    string_map = {}
+    for position, string_pos in props:
+        if string_pos not in string_map:
+            string_map[string_pos] = len(strings)
+            strings += get_string(data, header, string_pos, offset).encode('ascii') + b'\0'
+        pack_into('>I', body, position, string_map[string_pos])
+
+    blob_struct = pack('>II', DTB_BEGIN_NODE, 0) + body + pack('>I', DTB_END)
+    new_header = Header()
+    new_header.version = Header.MAX_VERSION
+    new_header.boot_cpuid_phys = header.boot_cpuid_phys
+    new_header.off_mem_rsvmap = new_header.size
+    new_header.off_dt_struct = new_header.size + 16
+    new_header.off_dt_strings = new_header.off_dt_struct + len(blob_struct)
+    new_header.size_dt_struct = len(blob_struct)
+    new_header.size_dt_strings = len(strings)
+    new_header.total_size = new_header.off_dt_strings + len(strings)
+    return new_header.export() + pack('>QQ', 0, 0) + blob_struct + bytes(strings)
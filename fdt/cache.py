@@ -0,0 +1,370 @@
+# Copyright 2017 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import hashlib
+import tempfile
+import threading
+from struct import pack
+from collections import OrderedDict
+
+from .items import PropBytes, PropWords, PropStrings, PropVariables, PropIncBin, iter_nodes, traverse
+from .misc import open_file, strip_compression_ext
+from .header import Header
+
+# Default memory limit of cached trees in bytes
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+# Default size limit of cache directory in bytes
+DEFAULT_DISK_CACHE_SIZE = 1024 * 1024 * 1024
+# Format version of snapshots in cache directory, increase it with every change of snapshot format
+SNAPSHOT_VERSION = 2
+SNAPSHOT_EXT = '.fdtc'
+# JSON decoder is recursive (two levels per node), deeper trees parsed from DTS or JSON are not stored
+MAX_JSON_SNAPSHOT_DEPTH = 256
+
+# Approximate memory footprint of objects used for cache size accounting
+NODE_SIZE = 400
+PROP_SIZE = 200
+WORD_SIZE = 36
+STRING_SIZE = 56
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def file_type_of(file_path: str) -> str:
+    """
+    Get input file type 'dtb', 'dts' or 'json' from file extension (compression extension is ignored)
+
+    :param file_path: The path to input file
+    """
+    base_path = strip_compression_ext(file_path)
+    for file_type in ('dtb', 'dts', 'json'):
+        if base_path.endswith('.' + file_type):
+            return file_type
+    raise Exception('Not supported file extension: {}'.format(file_path))
+
+
+def _parse_data(data: bytes, file_type: str, root_dir: str, is_only_diff: bool):
+    """ Parse content of input file, the text is decoded the same way as file opened in text mode """
+    from . import parse_dtb, parse_dts, parse_json
+    if file_type == 'dtb':
+        return parse_dtb(data)
+    text = io.TextIOWrapper(io.BytesIO(data)).read()
+    if file_type == 'json':
+        return parse_json(text)
+    return parse_dts(text, root_dir, is_only_diff)
+
+
+def _tree_size(fdt_obj) -> int:
+    """ Get approximate memory footprint of FDT Object in bytes """
+    size = 0
+    for _, node in iter_nodes(fdt_obj.root):
+        size += NODE_SIZE
+        for prop in node.props:
+            size += PROP_SIZE
+            if isinstance(prop, PropIncBin):
+                size += len(prop.data) if prop.loaded else 0
+            elif isinstance(prop, PropBytes):
+                size += len(prop.data)
+            elif isinstance(prop, PropWords):
+                size += len(prop.data) * WORD_SIZE
+            elif isinstance(prop, PropStrings):
+                size += sum(STRING_SIZE + len(s) for s in prop.data)
+            elif isinstance(prop, PropVariables):
+                size += STRING_SIZE + len(prop.data)
+    return size
+
+
+def _tree_depth(node) -> int:
+    """ Get count of node levels below the node """
+    max_depth = 0
+
+    def enter(node, path, depth):
+        nonlocal max_depth
+        max_depth = max(max_depth, depth)
+
+    traverse(node, enter)
+    return max_depth
+
+
+def parse_file(file_path: str, file_type: str = 'auto', is_only_diff: bool = False):
+    """
+    Parse *.dtb, *.dts or *.json input file (optionally gzip, xz or bz2 compressed) and return FDT object
+
+    :param file_path: The path to input file
+    :param file_type: File type 'dtb', 'dts', 'json' or 'auto'
+    :param is_only_diff: Passed to parse_dts()
+    """
+    if file_type == 'auto':
+        file_type = file_type_of(file_path)
+    with open_file(file_path, 'rb') as f:
+        data = f.read()
+    return _parse_data(data, file_type, os.path.dirname(file_path), is_only_diff)
+
+
+########################################################################################################################
+# Disk Cache Class
+########################################################################################################################
+
+class DiskCache:
+    """
+    Content-addressed directory of parsed tree snapshots with size limited LRU eviction. Snapshots are stored in
+    formats of the package: DTB blob for trees parsed from DTB files and JSON (see FDT.to_json) for other trees,
+    which keeps property types and /incbin/ references of DTS files. Snapshots are loaded through the trusted
+    construction path and validated, so the directory content is never executed.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_DISK_CACHE_SIZE):
+        """
+        DiskCache constructor. The directory can be shared by concurrent processes, snapshots are written
+        atomically and a broken or incompatible snapshot is handled as missing one.
+
+        :param cache_dir: The path to cache directory (created if doesn't exist)
+        :param max_size: Size limit of all snapshots in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(data: bytes, *params) -> str:
+        """
+        Get snapshot key from input content, parse parameters and parser version
+
+        :param data: The input file content
+        :param params: Parse parameters (file type, options, ...)
+        """
+        from . import __version__
+        hasher = hashlib.sha256(repr((SNAPSHOT_VERSION, __version__) + params).encode('utf-8'))
+        hasher.update(data)
+        return hasher.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + SNAPSHOT_EXT)
+
+    def get(self, key: str):
+        """
+        Get FDT object from snapshot or None
+
+        :param key: The snapshot key
+        """
+        from . import parse_dtb, parse_json
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            if data[:4] == pack('>I', Header.MAGIC_NUMBER):
+                fdt_obj = parse_dtb(data)
+            else:
+                fdt_obj = parse_json(data.decode('utf-8'))
+        except Exception:
+            # broken snapshot, e.g. written by incompatible version, or too deeply nested JSON
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            # modification time marks the last use for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return fdt_obj
+
+    def put(self, key: str, fdt_obj, binary: bool = False):
+        """
+        Save FDT object as snapshot (temporary file renamed into place) and evict least recently used snapshots.
+        The cache is best effort, a snapshot which can't be written is skipped.
+
+        :param key: The snapshot key
+        :param fdt_obj: The FDT object
+        :param binary: If True, the snapshot is stored as DTB blob (for trees parsed from DTB) else as JSON
+        """
+        if not binary and _tree_depth(fdt_obj.root) > MAX_JSON_SNAPSHOT_DEPTH:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            if binary:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(fdt_obj.to_dtb())
+            else:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    fdt_obj.to_json(f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used snapshots until the size limit is met """
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(SNAPSHOT_EXT):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total_size += stat.st_size
+        entries.sort()
+        # the most recent snapshot is kept
+        for _, size, path in entries[:-1]:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """ Remove all snapshots """
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(SNAPSHOT_EXT):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+
+########################################################################################################################
+# Tree Cache Class
+########################################################################################################################
+
+class TreeCache:
+    """ Thread-safe LRU cache of parsed trees limited by approximate memory size """
+
+    @property
+    def size(self):
+        return self._size
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, disk: DiskCache = None):
+        """
+        TreeCache constructor
+
+        :param max_size: Memory limit of cached trees in bytes
+        :param disk: Optional persistent cache used for trees which are not in memory
+        """
+        self.max_size = max_size
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """ Get count of cached trees """
+        return len(self._items)
+
+    def load(self, file_path: str, file_type: str = 'auto', is_only_diff: bool = False):
+        """
+        Get parsed tree of input file from cache or parse it. The entry is keyed by path, size, modification time
+        and content hash of the file, so a changed file is parsed again. Files included by DTS are not tracked.
+        The returned tree is frozen and shared between callers, use its copy() for modifications. If persistent
+        cache is set, the tree is loaded from its snapshot instead of parsing.
+
+        :param file_path: The path to input file
+        :param file_type: File type 'dtb', 'dts', 'json' or 'auto'
+        :param is_only_diff: Passed to parse_dts()
+        """
+        file_path = os.path.realpath(file_path)
+        if file_type == 'auto':
+            file_type = file_type_of(file_path)
+        stat = os.stat(file_path)
+        with open_file(file_path, 'rb') as f:
+            data = f.read()
+        key = (file_path, stat.st_size, stat.st_mtime_ns, hashlib.sha1(data).hexdigest(), file_type, is_only_diff)
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+
+        # parse outside of lock, concurrent miss of the same file only costs one redundant parse
+        root_dir = os.path.dirname(file_path)
+        disk = self.disk
+        fdt_obj = None
+        if disk is not None:
+            disk_key = disk.key(data, file_type, is_only_diff, root_dir)
+            fdt_obj = disk.get(disk_key)
+        if fdt_obj is None:
+            fdt_obj = _parse_data(data, file_type, root_dir, is_only_diff)
+            fdt_obj.freeze()
+            if disk is not None:
+                disk.put(disk_key, fdt_obj, file_type == 'dtb')
+        else:
+            fdt_obj.freeze()
+        size = _tree_size(fdt_obj)
+
+        with self._lock:
+            # drop outdated versions of the same file
+            for old_key in [k for k in self._items if k[0] == file_path and k[4:] == key[4:] and k != key]:
+                self._size -= self._items.pop(old_key)[1]
+            if key not in self._items:
+                self._items[key] = (fdt_obj, size)
+                self._size += size
+            self._items.move_to_end(key)
+            while self._size > self.max_size and len(self._items) > 1:
+                self._size -= self._items.popitem(last=False)[1][1]
+            return self._items[key][0]
+
+    def clear(self):
+        """ Remove all cached trees """
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+default_cache = TreeCache()
+
+
+def set_cache_dir(cache_dir: str, max_size: int = DEFAULT_DISK_CACHE_SIZE):
+    """
+    Enable persistent cache of the process wide tree cache (None disables it)
+
+    :param cache_dir: The path to cache directory
+    :param max_size: Size limit of cache directory in bytes
+    """
+    default_cache.disk = DiskCache(cache_dir, max_size) if cache_dir else None
+
+
+def load(file_path: str, file_type: str = 'auto', is_only_diff: bool = False):
+    """
+    Load input file through the process wide tree cache (see TreeCache.load), the returned tree is frozen
+
+    :param file_path: The path to input file
+    :param file_type: File type 'dtb', 'dts', 'json' or 'auto'
+    :param is_only_diff: Passed to parse_dts()
+    """
+    return default_cache.load(file_path, file_type, is_only_diff)
@@ -0,0 +1,156 @@
+# Copyright 2017 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from .items import Property, PropBytes, PropWords, PropStrings, PropVariables, PropIncBin, \
+    build_node, build_property, attach, traverse
+
+# Dict layout of node: {"props": {name: value, ...}, "nodes": {name: {...}, ...}}
+# Property values: null (empty), [int, ...] (words), [str, ...] (strings), {"bytes": "hex"}, {"expr": "text"},
+# {"incbin": file_name, "rpath": relative_path, "bytes": "hex"} or with "file", "offset", "size" for not loaded data
+
+
+########################################################################################################################
+# Property Values
+########################################################################################################################
+
+def prop_to_value(prop):
+    """
+    Get JSON compatible value of property
+
+    :param prop: The property object
+    """
+    if isinstance(prop, PropIncBin):
+        value = {'incbin': prop.file_name, 'rpath': prop.relative_path}
+        if prop.loaded or prop.file_path is None:
+            value['bytes'] = bytes(prop.data).hex()
+        else:
+            value.update(file=prop.file_path, offset=prop.offset, size=prop.size)
+        return value
+    if isinstance(prop, PropBytes):
+        return {'bytes': bytes(prop.data).hex()}
+    if isinstance(prop, (PropWords, PropStrings)):
+        return list(prop.data)
+    if isinstance(prop, PropVariables):
+        return {'expr': prop.data}
+    return None
+
+
+def value_to_prop(name: str, value):
+    """
+    Create property from JSON compatible value without validation
+
+    :param name: Property name
+    :param value: The property value
+    """
+    if value is None:
+        return build_property(Property, name)
+    if isinstance(value, list):
+        if value and isinstance(value[0], str):
+            return build_property(PropStrings, name, value)
+        return build_property(PropWords, name, value)
+    if 'incbin' in value:
+        if 'bytes' in value:
+            prop = build_property(PropIncBin, name, bytes.fromhex(value['bytes']))
+        else:
+            prop = PropIncBin(name, file_path=value['file'], offset=value['offset'], size=value['size'])
+        prop.file_name = value['incbin']
+        prop.relative_path = value.get('rpath')
+        return prop
+    if 'bytes' in value:
+        return build_property(PropBytes, name, bytes.fromhex(value['bytes']))
+    if 'expr' in value:
+        return build_property(PropVariables, name, value['expr'])
+    raise ValueError("{}: not supported value {!r}".format(name, value))
+
+
+########################################################################################################################
+# Node Conversion
+########################################################################################################################
+
+def node_to_dict(node) -> dict:
+    """
+    Convert node and all its sub-nodes into dict
+
+    :param node: The node object
+    """
+    dicts = []
+
+    def enter(node, path, depth):
+        item = {'props': {p.name: prop_to_value(p) for p in node.props}, 'nodes': {}}
+        if dicts:
+            dicts[-1]['nodes'][node.name] = item
+        dicts.append(item)
+
+    def leave(node, path, depth):
+        if len(dicts) > 1:
+            dicts.pop()
+
+    traverse(node, enter, leave)
+    return dicts[0]
+
+
+def node_from_dict(name: str, data: dict):
+    """
+    Create node with all sub-nodes from dict through the trusted construction path (without validation)
+
+    :param name: The node name
+    :param data: The node dict
+    """
+    root = build_node(name)
+    stack = [(root, data)]
+    while stack:
+        node, item = stack.pop()
+        for prop_name, value in item.get('props', {}).items():
+            attach(node, value_to_prop(prop_name, value))
+        for sub_name, sub_item in item.get('nodes', {}).items():
+            sub_node = build_node(sub_name)
+            attach(node, sub_node)
+            stack.append((sub_node, sub_item))
+    return root
+
+
+def write_json(fdt_obj, fp):
+    """
+    Write FDT object as JSON into file object in one streaming pass (no intermediate dict is created)
+
+    :param fdt_obj: The FDT object
+    :param fp: The text file object
+    """
+    header = fdt_obj.header
+    fp.write('{')
+    if header.version is not None:
+        fp.write('"version": {}, "last_comp_version": {}, "boot_cpuid_phys": {}, '.format(
+            header.version, header.last_comp_version, header.boot_cpuid_phys))
+    fp.write('"memreserve": {}, "root": '.format(json.dumps([[e['address'], e['size']] for e in fdt_obj.entries])))
+    first = [True]
+
+    def enter(node, path, depth):
+        if depth:
+            if not first[-1]:
+                fp.write(', ')
+            first[-1] = False
+            fp.write(json.dumps(node.name) + ': ')
+        fp.write('{"props": {')
+        fp.write(', '.join(json.dumps(p.name) + ': ' + json.dumps(prop_to_value(p)) for p in node.props))
+        fp.write('}, "nodes": {')
+        first.append(True)
+
+    def leave(node, path, depth):
+        first.pop()
+        fp.write('}}')
+
+    traverse(fdt_obj.root, enter, leave)
+    fp.write('}\n')
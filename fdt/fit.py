@@ -0,0 +1,321 @@
+# Copyright 2017 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import zlib
+import hashlib
+from struct import pack
+
+from .header import Header, DTB_BEGIN_NODE, DTB_END_NODE, DTB_PROP
+from .items import new_property, build_node, attach, get_raw_value, PropBytes, PropWords, PropStrings, Node
+from .blob import iter_tags, get_string
+
+# Properties bigger than this are not copied from image, they are accessed through memoryview
+LAZY_PROP_SIZE = 4096
+# Chunk size for streaming hash calculation and extraction
+CHUNK_SIZE = 1024 * 1024
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def _string_value(node: Node, name: str):
+    prop = node.get_property(name)
+    return prop.value if isinstance(prop, PropStrings) else None
+
+
+def _word_value(node: Node, name: str):
+    prop = node.get_property(name)
+    return prop.value if isinstance(prop, PropWords) else None
+
+
+########################################################################################################################
+# FIT Classes
+########################################################################################################################
+
+class PropView(PropBytes):
+    """Property with memoryview of image as value (not copied)"""
+
+    def __init__(self, name: str, view: memoryview):
+        """
+        PropView constructor
+
+        :param name: Property name
+        :param view: The memoryview of property value
+        """
+        super().__init__(name)
+        self.data = view
+
+    def __str__(self):
+        """ String representation """
+        return "{} = <{} bytes>".format(self.name, len(self.data))
+
+    def copy(self):
+        """ Create a copy of object (the value is copied into memory) """
+        return PropBytes(self.name, data=bytes(self.data))
+
+
+class FitImage:
+    """ Flattened Image Tree (FIT) with lazy access to embedded data """
+
+    @property
+    def images(self):
+        return self._images
+
+    @property
+    def configurations(self):
+        return self._configs
+
+    @property
+    def default_configuration(self):
+        configs = self.root.get_subnode('configurations')
+        return _string_value(configs, 'default') if configs is not None else None
+
+    def __init__(self, file_path: str):
+        """
+        FitImage constructor, map image file into memory and parse its tree. Data properties are exposed as
+        zero-copy memoryviews which are valid until close() is called.
+
+        :param file_path: The path to FIT image (*.itb)
+        """
+        self._file = open(file_path, 'rb')
+        self._mmap = None
+        self._view = None
+        self._views = []
+        self._images = {}
+        self._configs = {}
+        self.root = None
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+            self.header = Header.parse(self._mmap)
+            self.root = self._parse()
+            images = self.root.get_subnode('images')
+            for node in images.nodes if images is not None else []:
+                self._images[node.name] = FitEntry(self, node)
+            configs = self.root.get_subnode('configurations')
+            for node in configs.nodes if configs is not None else []:
+                self._configs[node.name] = FitConfig(self, node)
+        except Exception:
+            # release the file and mapping of an image which can't be parsed
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _parse(self):
+        root = None
+        current_node = None
+        for tag, _, info in iter_tags(self._mmap, self.header):
+            if tag == DTB_BEGIN_NODE:
+                new_node = build_node(info if info else '/')
+                if root is None:
+                    root = new_node
+                if current_node is not None:
+                    attach(current_node, new_node)
+                current_node = new_node
+            elif tag == DTB_END_NODE:
+                current_node = current_node.parent if current_node is not None else None
+            elif tag == DTB_PROP and current_node is not None:
+                prop_string_pos, prop_start, prop_size = info
+                prop_name = get_string(self._mmap, self.header, prop_string_pos)
+                if prop_size >= LAZY_PROP_SIZE:
+                    prop = PropView(prop_name, self.view(prop_start, prop_size))
+                else:
+                    prop = new_property(prop_name, self._mmap[prop_start:prop_start + prop_size], trusted=True)
+                attach(current_node, prop)
+        root.validate()
+        return root
+
+    def view(self, offset: int, size: int) -> memoryview:
+        """
+        Get zero-copy view of image content
+
+        :param offset: The offset from image start
+        :param size: The size in bytes
+        """
+        if offset < 0 or offset + size > len(self._mmap):
+            raise ValueError("Data out of image range: offset {}, size {}".format(offset, size))
+        view = self._view[offset:offset + size]
+        self._views.append(view)
+        return view
+
+    def close(self):
+        """ Unmap image file, all views of image content are released """
+        self.root = None
+        self._images.clear()
+        self._configs.clear()
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if self._view is not None:
+            self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class FitEntry:
+    """ Image node of FIT """
+
+    @property
+    def data(self) -> memoryview:
+        """ Embedded or external data as memoryview """
+        prop = self.node.get_property('data')
+        if prop is not None:
+            return prop.data if isinstance(prop, PropView) else memoryview(get_raw_value(prop))
+        if self._external_data is not None:
+            return self._external_data
+        size = _word_value(self.node, 'data-size')
+        position = _word_value(self.node, 'data-position')
+        offset = _word_value(self.node, 'data-offset')
+        if size is None or (position is None and offset is None):
+            return None
+        if position is None:
+            # external data offset is relative to the end of tree aligned to 4 bytes
+            position = ((self._fit.header.total_size + 3) & ~3) + offset
+        # the view is created once, views of the image are kept until it is closed
+        self._external_data = self._fit.view(position, size)
+        return self._external_data
+
+    @property
+    def description(self):
+        return _string_value(self.node, 'description')
+
+    @property
+    def type(self):
+        return _string_value(self.node, 'type')
+
+    @property
+    def arch(self):
+        return _string_value(self.node, 'arch')
+
+    @property
+    def os(self):
+        return _string_value(self.node, 'os')
+
+    @property
+    def compression(self):
+        return _string_value(self.node, 'compression')
+
+    @property
+    def load(self):
+        return _word_value(self.node, 'load')
+
+    @property
+    def entry(self):
+        return _word_value(self.node, 'entry')
+
+    def __init__(self, fit: FitImage, node: Node):
+        """
+        FitEntry constructor
+
+        :param fit: The FIT image
+        :param node: The image node
+        """
+        self._fit = fit
+        self._external_data = None
+        self.name = node.name
+        self.node = node
+
+    def __str__(self):
+        """ String representation """
+        data = self.data
+        return "{}: {} ({}, {} bytes)".format(self.name, self.description, self.type,
+                                              len(data) if data is not None else 0)
+
+    def hashes(self) -> list:
+        """ Get list of (algo, value) tuples from hash sub-nodes """
+        result = []
+        for node in self.node.nodes:
+            if node.name.startswith('hash'):
+                algo = _string_value(node, 'algo')
+                value = node.get_property('value')
+                if algo and value is not None:
+                    result.append((algo, get_raw_value(value)))
+        return result
+
+    def digest(self, algo: str) -> bytes:
+        """
+        Calculate digest of data in one streaming pass
+
+        :param algo: Hash algorithm name ('crc32', 'md5', 'sha1', 'sha256', ...)
+        """
+        data = self.data
+        if algo == 'crc32':
+            crc = 0
+            for i in range(0, len(data), CHUNK_SIZE):
+                crc = zlib.crc32(data[i:i + CHUNK_SIZE], crc)
+            return pack('>I', crc)
+        hasher = hashlib.new(algo)
+        for i in range(0, len(data), CHUNK_SIZE):
+            hasher.update(data[i:i + CHUNK_SIZE])
+        return hasher.digest()
+
+    def verify(self) -> bool:
+        """ Verify data against all hash sub-nodes, return False if any digest doesn't match """
+        return all(self.digest(algo) == value for algo, value in self.hashes())
+
+    def extract(self, file_path: str):
+        """
+        Save data into file
+
+        :param file_path: The output file path
+        """
+        data = self.data
+        with open(file_path, 'wb') as f:
+            for i in range(0, len(data), CHUNK_SIZE):
+                f.write(data[i:i + CHUNK_SIZE])
+
+
+class FitConfig:
+    """ Configuration node of FIT """
+
+    @property
+    def description(self):
+        return _string_value(self.node, 'description')
+
+    def __init__(self, fit: FitImage, node: Node):
+        """
+        FitConfig constructor
+
+        :param fit: The FIT image
+        :param node: The configuration node
+        """
+        self._fit = fit
+        self.name = node.name
+        self.node = node
+
+    def __str__(self):
+        """ String representation """
+        return "{}: {} ({})".format(self.name, self.description,
+                                    ', '.join("{}={}".format(k, ' '.join(v)) for k, v in self.refs().items()))
+
+    def refs(self) -> dict:
+        """ Get dict of referenced image names, e.g. {'kernel': ['kernel-1'], 'fdt': ['fdt-1']} """
+        return {p.name: list(p.data) for p in self.node.props if isinstance(p, PropStrings) and
+                p.name not in ('description', 'compatible')}
+
+    def images(self, kind: str) -> list:
+        """
+        Get list of referenced images
+
+        :param kind: Reference kind ('kernel', 'fdt', 'ramdisk', ...)
+        """
+        return [self._fit.images[name] for name in self.refs().get(kind, []) if name in self._fit.images]
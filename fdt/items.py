@@ -12,11 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from struct import pack, Struct
+import os
+from struct import pack, unpack, Struct
 from string import printable
 
 from .header import Header, DTB_PROP, DTB_BEGIN_NODE, DTB_END_NODE
-from .misc import is_string, line_offset
+from .misc import is_string, line_offset, PRINTABLE_CHARS
 
 BIGENDIAN_WORD = Struct(">I")
 
@@ -24,34 +25,118 @@ BIGENDIAN_WORD = Struct(">I")
 # Helper methods
 ########################################################################################################################
 
-def new_property(name: str, raw_value: bytes) -> object:
+def new_property(name: str, raw_value: bytes, trusted: bool = False) -> object:
     """
     Instantiate property with raw value type
 
     :param name: Property name
     :param raw_value: Property raw data
+    :param trusted: If True, the property is created without validation (see build_property)
     """
     if is_string(raw_value):
-        obj = PropStrings(name)
         # Extract strings from raw value
-        for st in raw_value.decode('ascii').split('\0'):
-            if st:
-                obj.append(st)
-        return obj
+        strings = [st for st in raw_value.decode('ascii').split('\0') if st]
+        if trusted:
+            return build_property(PropStrings, name, strings)
+        return PropStrings(name, *strings)
 
     elif len(raw_value) and len(raw_value) % 4 == 0:
-        obj = PropWords(name)
         # Extract words from raw value
-        obj.data = [BIGENDIAN_WORD.unpack(raw_value[i:i + 4])[0] for i in range(0, len(raw_value), 4)]
+        words = list(unpack('>{}I'.format(len(raw_value) // 4), raw_value))
+        if trusted:
+            return build_property(PropWords, name, words)
+        obj = PropWords(name)
+        obj.data = words
         return obj
 
     elif len(raw_value):
+        if trusted:
+            return build_property(PropBytes, name, raw_value)
         return PropBytes(name, data=raw_value)
 
     else:
+        if trusted:
+            return build_property(Property, name)
         return Property(name)
 
 
+def get_raw_value(prop) -> bytes:
+    """
+    Get property value in binary blob representation
+
+    :param prop: The property object
+    """
+    if isinstance(prop, PropWords):
+        return pack('>{}I'.format(len(prop.data)), *prop.data)
+    if isinstance(prop, PropStrings):
+        return b''.join(st.encode('ascii') + b'\0' for st in prop.data)
+    if isinstance(prop, PropBytes):
+        return bytes(prop.data)
+    if isinstance(prop, PropVariables):
+        return prop.data.encode('ascii')
+    return b''
+
+
+def build_node(name: str):
+    """
+    Create empty node without validation. Intended for parsers and converters with trusted input, the result can
+    be checked later with validate().
+
+    :param name: Node name
+    """
+    node = Node.__new__(Node)
+    node._name = name
+    node._parent = None
+    node._props = []
+    node._nodes = []
+    return node
+
+
+def build_property(cls, name: str, data=None):
+    """
+    Create property without validation. Intended for parsers and converters with trusted input, the result can
+    be checked later with validate().
+
+    :param cls: Property class (Property, PropWords, PropBytes, PropStrings, PropVariables or PropIncBin)
+    :param name: Property name
+    :param data: Property value (list of words or strings, bytes or variables string)
+    """
+    prop = cls.__new__(cls)
+    prop._name = name
+    prop._parent = None
+    if issubclass(cls, PropIncBin):
+        prop.file_name = None
+        prop.relative_path = None
+        prop.file_path = None
+        prop.offset = 0
+        prop.size = 0
+        prop.data = bytearray(data) if data is not None else bytearray()
+    elif issubclass(cls, PropBytes):
+        prop.data = data if isinstance(data, bytearray) else bytearray(data) if data is not None else bytearray()
+    elif issubclass(cls, PropWords):
+        prop.data = data if data is not None else []
+        prop.word_size = 32
+    elif issubclass(cls, PropStrings):
+        prop.data = data if data is not None else []
+    elif issubclass(cls, PropVariables):
+        prop.data = data
+    return prop
+
+
+def attach(node, item):
+    """
+    Append property or sub-node to node without validation (no duplicate check)
+
+    :param node: The parent node
+    :param item: The node or property object
+    """
+    item._parent = node
+    if isinstance(item, Property):
+        node._props.append(item)
+    else:
+        node._nodes.append(item)
+
+
 ########################################################################################################################
 # Base Class
 ########################################################################################################################
@@ -76,6 +161,10 @@ class BaseItem:
             node = node.parent
         return path if path else '/'
 
+    @property
+    def frozen(self):
+        return False
+
     def __init__(self, name: str):
         """ 
         BaseItem constructor
@@ -99,6 +188,7 @@ class BaseItem:
         """
         assert isinstance(value, str)
         assert all(c in printable for c in value), "The value must contain just printable chars !"
+        self._check_mutable()
         self._name = value
 
     def set_parent(self, value):
@@ -108,8 +198,18 @@ class BaseItem:
         :param value: The parent node 
         """
         assert isinstance(value, Node)
+        self._check_mutable()
         self._parent = value
 
+    def _check_mutable(self):
+        if self.frozen:
+            raise Exception("{}: \"{}\" is frozen, modify a copy".format(self.path, self.name))
+
+    def validate(self):
+        """ Check item validity, raise ValueError if item is invalid """
+        if not isinstance(self._name, str) or not PRINTABLE_CHARS.issuperset(self._name):
+            raise ValueError("Invalid name {!r}, the value must contain just printable chars !".format(self._name))
+
     def to_dts(self, tabsize: int = 4, depth: int = 0):
         raise NotImplementedError()
 
@@ -123,6 +223,20 @@ class BaseItem:
 
 class Property(BaseItem):
 
+    @property
+    def frozen(self):
+        # property is frozen together with its node
+        return self._parent is not None and self._parent.frozen
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._check_mutable()
+        self._data = value
+
     def __getitem__(self, value):
         """ Returns No Items """
         return None
@@ -208,15 +322,25 @@ class PropStrings(Property):
         assert isinstance(value, str)
         assert len(value) > 0, "Invalid strings value"
         assert all(c in printable or c in ('\r', '\n') for c in value), "Invalid chars in strings value"
+        self._check_mutable()
         self.data.append(value)
 
     def pop(self, index: int):
         assert 0 <= index < len(self.data), "Index out of range"
+        self._check_mutable()
         return self.data.pop(index)
 
     def clear(self):
+        self._check_mutable()
         self.data.clear()
 
+    def validate(self):
+        """ Check property validity, raise ValueError if property is invalid """
+        super().validate()
+        for value in self.data:
+            if not isinstance(value, str) or not value or not PRINTABLE_CHARS.issuperset(value):
+                raise ValueError("{}: invalid strings value {!r}".format(self.name, value))
+
     def to_dts(self, tabsize: int = 4, depth: int = 0):
         """
         Get string representation
@@ -350,15 +474,26 @@ class PropWords(Property):
         assert isinstance(value, int), "Invalid object type"
         assert 0 <= value < 2**self.word_size, "Invalid word value {}, use <0x0 - 0x{:X}>".format(
             value, 2**self.word_size - 1)
+        self._check_mutable()
         self.data.append(value)
 
     def pop(self, index):
         assert 0 <= index < len(self.data), "Index out of range"
+        self._check_mutable()
         return self.data.pop(index)
 
     def clear(self):
+        self._check_mutable()
         self.data.clear()
 
+    def validate(self):
+        """ Check property validity, raise ValueError if property is invalid """
+        super().validate()
+        limit = 2**self.word_size
+        for value in self.data:
+            if not isinstance(value, int) or not 0 <= value < limit:
+                raise ValueError("{}: invalid word value {!r}, use <0x0 - 0x{:X}>".format(self.name, value, limit - 1))
+
     def to_dts(self, tabsize: int = 4, depth: int = 0):
         """
         Get string representation
@@ -439,15 +574,25 @@ class PropBytes(Property):
     def append(self, value):
         assert isinstance(value, int), "Invalid object type"
         assert 0 <= value <= 0xFF, "Invalid byte value {}, use <0 - 255>".format(value)
+        self._check_mutable()
         self.data.append(value)
 
     def pop(self, index):
         assert 0 <= index < len(self.data), "Index out of range"
+        self._check_mutable()
         return self.data.pop(index)
 
     def clear(self):
+        self._check_mutable()
         self.data = bytearray()
 
+    def validate(self):
+        """ Check property validity, raise ValueError if property is invalid """
+        super().validate()
+        if not isinstance(self.data, (bytes, bytearray, memoryview)) and \
+           not all(isinstance(value, int) and 0 <= value <= 0xFF for value in self.data):
+            raise ValueError("{}: invalid bytes value".format(self.name))
+
     def to_dts(self, tabsize: int = 4, depth: int = 0):
         """
         Get string representation
@@ -482,9 +627,25 @@ class PropBytes(Property):
 
 
 class PropIncBin(PropBytes):
-    """Property with bytes as value"""
+    """Property with bytes as value, optionally loaded from file on demand"""
 
-    def __init__(self, name, data=None, file_name=None, rpath=None):
+    @property
+    def data(self):
+        if self._data is None:
+            # data loaded into frozen tree are read-only as well
+            self._data = self._read() if self.frozen else bytearray(self._read())
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._check_mutable()
+        self._data = value
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __init__(self, name, data=None, file_name=None, rpath=None, file_path=None, offset=0, size=0):
         """
         PropIncBin constructor
 
@@ -492,11 +653,27 @@ class PropIncBin(PropBytes):
         :param data: Data as list, bytes or bytearray
         :param file_name: File name
         :param rpath: Relative path
+        :param file_path: Path to data file, if data is None the file content is loaded on demand
+        :param offset: The offset of data in file
+        :param size: The size of data in file (0 means up to the end of file)
         """
-        super().__init__(name, data)
+        self.file_path = file_path
+        self.offset = offset
+        self.size = size
+        super().__init__(name, data=data)
+        if data is None and file_path is not None:
+            self._data = None
         self.file_name = file_name
         self.relative_path = rpath
 
+    def __len__(self):
+        """ Get bytes count (without loading the data) """
+        if self._data is None:
+            # the same count as read from file, which may be shorter than the declared size
+            available = max(0, os.path.getsize(self.file_path) - self.offset)
+            return min(self.size, available) if self.size > 0 else available
+        return len(self._data)
+
     def __eq__(self, prop):
         """ Check PropIncBin object equality  """
         if not isinstance(prop, PropIncBin):
@@ -507,13 +684,51 @@ class PropIncBin(PropBytes):
             return False
         if self.relative_path != prop.relative_path:
             return False
+        if not self.loaded and not prop.loaded and \
+           (self.file_path, self.offset, self.size) == (prop.file_path, prop.offset, prop.size):
+            return True
         if self.data != prop.data:
             return False
         return True
 
+    def validate(self):
+        """ Check property validity without loading the data, raise ValueError if property is invalid """
+        if self._data is None:
+            BaseItem.validate(self)
+        else:
+            super().validate()
+
+    def _read(self) -> bytes:
+        """ Read data from file """
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            return f.read(self.size) if self.size > 0 else f.read()
+
     def copy(self):
         """ Create a copy of object """
-        return PropIncBin(self.name, self.data, self.file_name, self.relative_path)
+        return PropIncBin(self.name, self._data, self.file_name, self.relative_path, self.file_path, self.offset,
+                          self.size)
+
+    def to_dtb(self, strings: str, pos: int = 0, version: int = Header.MAX_VERSION):
+        """
+        Get blob representation, not loaded data are read from file directly into the blob
+
+        :param strings:
+        :param pos:
+        :param version:
+        """
+        if self._data is not None:
+            return super().to_dtb(strings, pos, version)
+        strpos = strings.find(self.name + '\0')
+        if strpos < 0:
+            strpos = len(strings)
+            strings += self.name + '\0'
+        data = self._read()
+        blob = pack('>III', DTB_PROP, len(data), strpos) + data
+        if len(blob) % 4:
+            blob += bytes(4 - (len(blob) % 4))
+        pos += len(blob)
+        return blob, strings, pos
 
     def to_dts(self, tabsize: int = 4, depth: int = 0):
         """
@@ -526,7 +741,10 @@ class PropIncBin(PropBytes):
         if self.relative_path is not None:
             file_path = "{}/{}".format(self.relative_path, self.file_name)
         result  = line_offset(tabsize, depth, self.name)
-        result += " = /incbin/(\"{}\");\n".format(file_path)
+        if self.offset or self.size:
+            result += " = /incbin/(\"{}\", {:#x}, {:#x});\n".format(file_path, self.offset, self.size)
+        else:
+            result += " = /incbin/(\"{}\");\n".format(file_path)
         return result
 
 
@@ -549,6 +767,10 @@ class Node(BaseItem):
     def empty(self):
         return False if self.nodes or self.props else True
 
+    @property
+    def frozen(self):
+        return isinstance(self._nodes, tuple)
+
     def __init__(self, name, *args):
         """ 
         Node constructor
@@ -570,26 +792,42 @@ class Node(BaseItem):
         """ Check node equality """
         if not isinstance(node, Node):
             return False
-        if self.name != node.name or \
-           len(self.props) != len(node.props) or \
-           len(self.nodes) != len(node.nodes):
-            return False
-        for p in self.props:
-            if p not in node.props:
-                return False
-        for n in self.nodes:
-            if n not in node.nodes:
+        pairs = [(self, node)]
+        while pairs:
+            node_a, node_b = pairs.pop()
+            if node_a.name != node_b.name or \
+               len(node_a.props) != len(node_b.props) or \
+               len(node_a.nodes) != len(node_b.nodes):
                 return False
+            props = {p.name: p for p in node_b.props}
+            for p in node_a.props:
+                if p != props.get(p.name):
+                    return False
+            nodes = {n.name: n for n in node_b.nodes}
+            for n in node_a.nodes:
+                if n.name not in nodes:
+                    return False
+                pairs.append((n, nodes[n.name]))
         return True
 
     def copy(self):
         """ Create a copy of Node object """
-        node = Node(self.name)
-        for p in self.props:
-            node.append(p.copy())
-        for n in self.nodes:
-            node.append(n.copy())
-        return node
+        copies = []
+
+        def enter(node, path, depth):
+            new_node = build_node(node.name)
+            for p in node.props:
+                attach(new_node, p.copy())
+            if copies:
+                attach(copies[-1], new_node)
+            copies.append(new_node)
+
+        def leave(node, path, depth):
+            if len(copies) > 1:
+                copies.pop()
+
+        traverse(self, enter, leave)
+        return copies[0]
 
     def get_property(self, name):
         """ 
@@ -609,6 +847,7 @@ class Node(BaseItem):
         :param name: Property name
         :param value: Property value
         """
+        self._check_mutable()
         if value is None:
             new_prop = Property(name)
         elif isinstance(value, int):
@@ -664,6 +903,7 @@ class Node(BaseItem):
         
         :param name: Property name
         """
+        self._check_mutable()
         item = self.get_property(name)
         if item is not None:
             self.props.remove(item)
@@ -674,6 +914,7 @@ class Node(BaseItem):
         
         :param name: Subnode name
         """
+        self._check_mutable()
         item = self.get_subnode(name)
         if item is not None:
             self.nodes.remove(item)
@@ -685,6 +926,7 @@ class Node(BaseItem):
         :param item: The node or property object
         """
         assert isinstance(item, (Node, Property)), "Invalid object type, use \"Node\" or \"Property\""
+        self._check_mutable()
 
         if isinstance(item, Property):
             if self.get_property(item.name) is not None:
@@ -708,40 +950,100 @@ class Node(BaseItem):
         :param replace: If True, replace current properties with the given properties
         """
         assert isinstance(node_obj, Node), "Invalid object type"
-
-        def get_property_index(name):
-            for i, p in enumerate(self.props):
-                if p.name == name:
-                    return i
-            return None
-
-        def get_subnode_index(name):
-            for i, n in enumerate(self.nodes):
-                if n.name == name:
-                    return i
-            return None
-
-        for prop in node_obj.props:
-            index = get_property_index(prop.name)
-            if index is None:
-                self.append(prop.copy())
-            elif prop in self._props:
-                continue
-            elif replace:
-                new_prop = prop.copy()
-                new_prop.set_parent(self)
-                self._props[index] = new_prop
-            else:
-                pass
-
-        for sub_node in node_obj.nodes:
-            index = get_subnode_index(sub_node.name)
-            if index is None:
-                self.append(sub_node.copy())
-            elif sub_node in self._nodes:
-                continue
+        self._check_mutable()
+
+        targets = []
+
+        def merge_props(target, node):
+            for prop in node.props:
+                index = next((i for i, p in enumerate(target.props) if p.name == prop.name), None)
+                if index is None:
+                    target.append(prop.copy())
+                elif prop in target.props:
+                    continue
+                elif replace:
+                    new_prop = prop.copy()
+                    new_prop.set_parent(target)
+                    target.props[index] = new_prop
+
+        def enter(node, path, depth):
+            if not targets:
+                target = self
             else:
-                self._nodes[index].merge(sub_node, replace)
+                parent = targets[-1]
+                target = parent.get_subnode(node.name)
+                if target is None:
+                    parent.append(node.copy())
+                    return False
+                if node in parent.nodes:
+                    return False
+            merge_props(target, node)
+            targets.append(target)
+
+        def leave(node, path, depth):
+            targets.pop()
+
+        traverse(node_obj, enter, leave)
+
+    def freeze(self):
+        """
+        Make node and all sub-nodes read-only: lists of properties, sub-nodes and property values are converted
+        into tuples and bytes, so the tree can be shared without copying. Use copy() to get a modifiable tree.
+        """
+        def enter(node, path, depth):
+            if node.frozen:
+                return False
+            for prop in node.props:
+                if isinstance(prop, PropIncBin):
+                    # keep not loaded data lazy
+                    if prop.loaded:
+                        prop._data = bytes(prop._data)
+                elif isinstance(prop, PropBytes):
+                    if isinstance(prop.data, bytearray) or (isinstance(prop.data, memoryview) and not prop.data.readonly):
+                        prop.data = bytes(prop.data)
+                elif isinstance(prop, (PropWords, PropStrings)):
+                    prop.data = tuple(prop.data)
+            node._props = tuple(node._props)
+            node._nodes = tuple(node._nodes)
+
+        traverse(self, enter)
+
+    def validate(self):
+        """ Check validity of node, its properties and all sub-nodes, raise ValueError if anything is invalid """
+        def enter(node, path, depth):
+            BaseItem.validate(node)
+            names = set()
+            for prop in node.props:
+                prop.validate()
+                if prop.name in names:
+                    raise ValueError("{}: \"{}\" property already exists".format(node, prop.name))
+                if prop.parent is not node:
+                    raise ValueError("{}: invalid parent of \"{}\" property".format(node, prop.name))
+                names.add(prop.name)
+            names = set()
+            for sub_node in node.nodes:
+                if sub_node.name in names:
+                    raise ValueError("{}: \"{}\" node already exists".format(node, sub_node.name))
+                if sub_node.parent is not node:
+                    raise ValueError("{}: invalid parent of \"{}\" node".format(node, sub_node.name))
+                names.add(sub_node.name)
+
+        traverse(self, enter)
+
+    def sort(self, recursive: bool = True):
+        """
+        Sort properties and sub-nodes by name
+
+        :param recursive: Sort in all sub-nodes (default: True)
+        """
+        self._check_mutable()
+
+        def enter(node, path, depth):
+            node.props.sort(key=lambda p: p.name)
+            node.nodes.sort(key=lambda n: n.name)
+            return recursive
+
+        traverse(self, enter)
 
     def to_dts(self, tabsize: int = 4, depth: int = 0) -> str:
         """ 
@@ -750,11 +1052,17 @@ class Node(BaseItem):
         :param tabsize: Tabulator size in count of spaces
         :param depth: Start depth for line
         """
-        dts  = line_offset(tabsize, depth, self.name + ' {\n')
-        dts += ''.join(prop.to_dts(tabsize, depth + 1) for prop in self._props)
-        dts += ''.join(node.to_dts(tabsize, depth + 1) for node in self._nodes)
-        dts += line_offset(tabsize, depth, "};\n")
-        return dts
+        dts = []
+
+        def enter(node, path, level):
+            dts.append(line_offset(tabsize, depth + level, node.name + ' {\n'))
+            dts.extend(prop.to_dts(tabsize, depth + level + 1) for prop in node.props)
+
+        def leave(node, path, level):
+            dts.append(line_offset(tabsize, depth + level, "};\n"))
+
+        traverse(self, enter, leave)
+        return ''.join(dts)
 
     def to_dtb(self, strings: str, pos: int = 0, version: int = Header.MAX_VERSION) -> tuple:
         """ 
@@ -764,20 +1072,74 @@ class Node(BaseItem):
         :param pos:
         :param version:
         """
-        if self.name == '/':
-            blob = pack('>II', DTB_BEGIN_NODE, 0)
-        else:
-            blob = pack('>I', DTB_BEGIN_NODE)
-            blob += self.name.encode('ascii') + b'\0'
-        if len(blob) % 4:
-            blob += pack('b', 0) * (4 - (len(blob) % 4))
-        pos += len(blob)
-        for prop in self._props:
-            (data, strings, pos) = prop.to_dtb(strings, pos, version)
-            blob += data
-        for node in self._nodes:
-            (data, strings, pos) = node.to_dtb(strings, pos, version)
-            blob += data
-        pos += 4
-        blob += pack('>I', DTB_END_NODE)
-        return blob, strings, pos
+        blob = []
+
+        def enter(node, path, depth):
+            nonlocal strings, pos
+            if node.name == '/':
+                data = pack('>II', DTB_BEGIN_NODE, 0)
+            else:
+                data = pack('>I', DTB_BEGIN_NODE)
+                data += node.name.encode('ascii') + b'\0'
+            if len(data) % 4:
+                data += pack('b', 0) * (4 - (len(data) % 4))
+            pos += len(data)
+            blob.append(data)
+            for prop in node.props:
+                (data, strings, pos) = prop.to_dtb(strings, pos, version)
+                blob.append(data)
+
+        def leave(node, path, depth):
+            nonlocal pos
+            pos += 4
+            blob.append(pack('>I', DTB_END_NODE))
+
+        traverse(self, enter, leave)
+        return b''.join(blob), strings, pos
+
+
+########################################################################################################################
+# Traversal
+########################################################################################################################
+
+def traverse(node: Node, enter=None, leave=None, path: str = None):
+    """
+    Iterative depth-first traversal of node tree in document order
+
+    :param node: The top node of traversal
+    :param enter: Called as enter(node, path, depth) before sub-nodes, return False to skip the sub-nodes
+    :param leave: Called as leave(node, path, depth) after all sub-nodes were visited
+    :param path: The path of top node, if None the paths are not built and callbacks receive None
+    """
+    stack = [(node, path, 0, False)]
+    while stack:
+        node, path, depth, done = stack.pop()
+        if done:
+            leave(node, path, depth)
+            continue
+        if enter is not None and enter(node, path, depth) is False:
+            continue
+        if leave is not None:
+            stack.append((node, path, depth, True))
+        if node.nodes:
+            if path is None:
+                stack.extend((sub, None, depth + 1, False) for sub in reversed(node.nodes))
+            else:
+                prefix = path if not path or path.endswith('/') else path + '/'
+                stack.extend((sub, prefix + sub.name, depth + 1, False) for sub in reversed(node.nodes))
+
+
+def iter_nodes(node: Node, path: str = '/'):
+    """
+    Iterate over node and all its sub-nodes in document order and yield (path, node) tuples
+
+    :param node: The top node
+    :param path: The path of top node
+    """
+    stack = [(node, path)]
+    while stack:
+        node, path = stack.pop()
+        yield path, node
+        if node.nodes:
+            prefix = path if not path or path.endswith('/') else path + '/'
+            stack.extend((sub, prefix + sub.name) for sub in reversed(node.nodes))
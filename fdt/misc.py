@@ -13,26 +13,34 @@
 # limitations under the License.
 
 import re
+import os
+import bz2
+import gzip
+import lzma
+from functools import partial
 from string import printable
 
+# Openers of compressed files, legacy .lzma files use the "alone" format instead of the XZ container
+_open_lzma_alone = partial(lzma.open, format=lzma.FORMAT_ALONE)
+COMPRESSION_EXTS = {'.gz': gzip.open, '.xz': lzma.open, '.lzma': _open_lzma_alone, '.bz2': bz2.open}
+COMPRESSION_MAGICS = ((b'\x1f\x8b', gzip.open), (b'\xfd7zXZ\x00', lzma.open), (b'\x5d\x00\x00', _open_lzma_alone),
+                      (b'BZh', bz2.open))
+
+
+# Bytes allowed in string property value (printable chars without line ends) and the NUL terminator
+STRING_BYTES = bytes(c for c in printable.encode() if c not in (ord('\r'), ord('\n'))) + b'\0'
+# Chars allowed in item names
+PRINTABLE_CHARS = frozenset(printable)
+
 
 def is_string(data):
     """ Check property string validity """
     if not len(data):
         return None
-    if data[-1] != 0:
+    if data[-1] != 0 or data[0] == 0:
+        return None
+    if b'\0\0' in data or bytes(data).translate(None, STRING_BYTES):
         return None
-    pos = 0
-    while pos < len(data):
-        posi = pos
-        while pos < len(data) and \
-              data[pos] != 0 and \
-              data[pos] in printable.encode() and \
-              data[pos] not in (ord('\r'), ord('\n')):
-            pos += 1
-        if data[pos] != 0 or pos == posi:
-            return None
-        pos += 1
     return True
 
 
@@ -87,3 +95,31 @@ def split_to_lines(text):
 
     return lines
 
+
+def strip_compression_ext(file_path):
+    """ Get file path without compression extension (e.g. board.dtb.gz -> board.dtb) """
+    root, ext = os.path.splitext(file_path)
+    return root if ext.lower() in COMPRESSION_EXTS else file_path
+
+
+def open_file(file_path, mode='r'):
+    """
+    Open file with transparent streaming (de)compression. For reading the compression is detected from magic bytes,
+    for writing from the file extension (.gz, .xz, .lzma or .bz2).
+
+    :param file_path: The path to file
+    :param mode: File mode 'r', 'rb', 'w' or 'wb'
+    """
+    opener = None
+    if 'r' in mode:
+        with open(file_path, 'rb') as f:
+            magic = f.read(6)
+        for signature, compressed_opener in COMPRESSION_MAGICS:
+            if magic.startswith(signature):
+                opener = compressed_opener
+                break
+    else:
+        opener = COMPRESSION_EXTS.get(os.path.splitext(file_path)[1].lower())
+    if opener is None:
+        return open(file_path, mode)
+    return opener(file_path, mode if 'b' in mode else mode + 't')
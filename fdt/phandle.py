@@ -0,0 +1,151 @@
+# Copyright 2017 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from collections import namedtuple
+
+from .items import PropWords, iter_nodes
+
+
+########################################################################################################################
+# Phandle Properties
+########################################################################################################################
+
+# Properties with list of <phandle arg1 arg2 ...> specifiers and the provider property with count of args
+SPECIFIER_PROPS = {
+    'clocks': '#clock-cells',
+    'assigned-clocks': '#clock-cells',
+    'assigned-clock-parents': '#clock-cells',
+    'resets': '#reset-cells',
+    'interrupts-extended': '#interrupt-cells',
+    'power-domains': '#power-domain-cells',
+    'dmas': '#dma-cells',
+    'phys': '#phy-cells',
+    'pwms': '#pwm-cells',
+    'iommus': '#iommu-cells',
+    'mboxes': '#mbox-cells',
+    'io-channels': '#io-channel-cells',
+    'thermal-sensors': '#thermal-sensor-cells',
+    'hwlocks': '#hwlock-cells',
+    'sound-dai': '#sound-dai-cells',
+    'interconnects': '#interconnect-cells',
+    'cooling-device': '#cooling-cells',
+    'gpios': '#gpio-cells',
+}
+
+# Properties with list of plain phandles (no args)
+PHANDLE_PROPS = ('interrupt-parent', 'memory-region', 'nvmem-cells', 'phy-handle', 'remote-endpoint', 'cpu')
+
+GPIO_PROP = re.compile(r'^.+-gpios?$')
+PINCTRL_PROP = re.compile(r'^pinctrl-[0-9]+$')
+SUPPLY_PROP = re.compile(r'^.+-supply$')
+
+
+def _cells_prop_name(prop_name: str):
+    """ Return the name of #*-cells provider property, '' for plain phandle list or None for other properties """
+    if prop_name in SPECIFIER_PROPS:
+        return SPECIFIER_PROPS[prop_name]
+    if prop_name in PHANDLE_PROPS or PINCTRL_PROP.match(prop_name) or SUPPLY_PROP.match(prop_name):
+        return ''
+    if GPIO_PROP.match(prop_name):
+        return '#gpio-cells'
+    return None
+
+
+########################################################################################################################
+# Phandle Graph Class
+########################################################################################################################
+
+Reference = namedtuple('Reference', ['source', 'prop', 'target', 'args'])
+
+
+class PhandleGraph:
+    """ Cross-reference graph of nodes linked through phandle-valued properties """
+
+    def __init__(self, fdt_obj):
+        """
+        PhandleGraph constructor. Note that parse_dts() drops phandle properties, so build the graph from DTB.
+
+        :param fdt_obj: The object of FDT
+        """
+        self._phandles = {}
+        self._cells = {}
+        self._users = {}
+        self._deps = {}
+        self.unresolved = []
+
+        # single pass over the tree: collect phandles and candidate properties
+        candidates = []
+        for path, node in iter_nodes(fdt_obj.root):
+            phandle = node.get_property('phandle') or node.get_property('linux,phandle')
+            if isinstance(phandle, PropWords) and phandle.value is not None:
+                self._phandles[phandle.value] = path
+                self._cells[path] = {p.name: p.value for p in node.props
+                                     if p.name.startswith('#') and p.name.endswith('-cells') and
+                                     isinstance(p, PropWords)}
+            for prop in node.props:
+                if isinstance(prop, PropWords):
+                    cells_name = _cells_prop_name(prop.name)
+                    if cells_name is not None:
+                        candidates.append((path, prop, cells_name))
+
+        # decode specifier lists
+        for path, prop, cells_name in candidates:
+            self._decode(path, prop, cells_name)
+
+    def _decode(self, path: str, prop, cells_name: str):
+        index = 0
+        while index < len(prop.data):
+            phandle = prop.data[index]
+            index += 1
+            if phandle == 0:
+                # empty entry (e.g. in gpios list)
+                continue
+            target = self._phandles.get(phandle)
+            if target is None:
+                self.unresolved.append((path, prop.name, phandle))
+                return
+            count = self._cells[target].get(cells_name, 0) if cells_name else 0
+            ref = Reference(path, prop.name, target, tuple(prop.data[index:index + count]))
+            index += count
+            self._deps.setdefault(path, []).append(ref)
+            self._users.setdefault(target, []).append(ref)
+
+    def node_path(self, phandle: int):
+        """
+        Get path of node with specified phandle or None
+
+        :param phandle: The phandle value
+        """
+        return self._phandles.get(phandle)
+
+    def users(self, path: str) -> list:
+        """
+        Get list of references pointing to node at specified path
+
+        :param path: The node path
+        """
+        return self._users.get(path, [])
+
+    def deps(self, path: str) -> list:
+        """
+        Get list of references from node at specified path to other nodes
+
+        :param path: The node path
+        """
+        return self._deps.get(path, [])
+
+    def unused(self) -> list:
+        """ Get list of paths of nodes with phandle which are not referenced """
+        return [path for path in self._phandles.values() if path not in self._users]
@@ -1,12 +1,15 @@
 import ast
 import configparser
 import json
+import mmap
 import os
 import re
 import subprocess
 from subprocess import PIPE
 import sys
 import tempfile
+from array import array
+from collections import OrderedDict
 
 def getFileName(filename: str):
     return os.path.splitext(os.path.basename(filename))[0]
@@ -117,6 +120,55 @@ def annotateDTS(dtsFile, incIncludes, out_dir = None, level = 2):
 
     return tmpAnnotatedFileName
 
+class SourceCache:
+
+    def __init__(self, max_files=64):
+        # Memory-mapped source files with offsets of their lines, least recently used first
+        self.max_files = max_files
+        self.files = OrderedDict()
+
+    def get_lines(self, file_name, start_line, end_line):
+        """Get text of lines start_line to end_line (numbered from 1) of a source file."""
+        data, offsets = self.load(file_name)
+        size = len(data)
+        start = offsets[start_line - 1] if 0 < start_line <= len(offsets) else size
+        end = offsets[end_line] if 0 <= end_line < len(offsets) else size
+        return data[start:end].decode('utf-8', 'replace').replace('\r\n', '\n')
+
+    def load(self, file_name):
+        """Get contents and line offsets of a file, the file is loaded again if it was modified."""
+        stat = os.stat(file_name)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self.files.get(file_name)
+        if entry is not None:
+            if entry[0] == version:
+                self.files.move_to_end(file_name)
+                return entry[1], entry[2]
+            self.remove(file_name)
+
+        with open(file_name, 'rb') as f:
+            # Empty file can't be mapped
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        offsets = array('Q', [0])
+        offsets.extend(match.end() for match in re.finditer(b'\n', data))
+
+        self.files[file_name] = (version, data, offsets)
+        while len(self.files) > self.max_files:
+            self.remove(next(iter(self.files)))
+        return data, offsets
+
+    def remove(self, file_name):
+        """Remove a file from the cache."""
+        _, data, _ = self.files.pop(file_name)
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    def clear(self):
+        """Remove all files from the cache."""
+        for file_name in list(self.files):
+            self.remove(file_name)
+
+
 class ConfigHelper:
 
     def __init__(self):
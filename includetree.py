@@ -1,6 +1,7 @@
 import os
 import re
-from PyQt6 import QtWidgets
+from PyQt6 import QtCore
+from PyQt6.QtCore import Qt, QModelIndex
 import traceback
 
 class includeTree(object):
@@ -73,15 +74,22 @@ class includeTree(object):
                         if (includeFileFull):
                             #print('Found!', includeFileFull)
 
-                            # This triggers findIncludedFiles()
-                            # for the child node.
-                            includeFileNode = includeTree(includeFileFull,
-                                                          includeDirs,
-                                                          includeMacros)
+                            # A file included more times is parsed once and shares its node
+                            includeFileNode = currentNode.parsedFiles.get(includeFileFull)
+
+                            if includeFileNode is None:
+                                # This triggers findIncludedFiles()
+                                # for the child node.
+                                includeFileNode = includeTree(includeFileFull,
+                                                              includeDirs,
+                                                              includeMacros,
+                                                              currentNode.parsedFiles)
 
                             # NOTE: By now, the child node contains
                             # all its children (further included files).
-                            currentNode.addChild(includeFileNode)
+                            # Skip a file including itself (it is still being parsed)
+                            if not includeFileNode.parsing:
+                                currentNode.addChild(includeFileNode)
 
         except Exception as e:
             print('EXCEPTION!', e)
@@ -94,20 +102,12 @@ class includeTree(object):
     def fileName(self):
         return self.file.split('/')[-1]
 
-    def populateChildrenFileNames(self, parentRowItem):
-
-        # skip header files
-        if self.fileName().split('.')[-1] == 'h':
-            return
-
-        # add curent node...
-        currItem = QtWidgets.QTreeWidgetItem([self.fileName()])
-        currItem.setToolTip(0, self.file)
-        parentRowItem.addChild(currItem)
+    def isHeader(self):
+        return self.fileName().split('.')[-1] == 'h'
 
-        # ...and recursively look for any children nodes to print
-        for node in self.children:
-            node.populateChildrenFileNames(currItem)
+    # Included files shown in the tree (header files are skipped)
+    def shownChildren(self):
+        return [node for node in self.children if not node.isHeader()]
 
     def printFileName(self, level=0):
         print('\t' * level, self.fileName())
@@ -128,9 +128,149 @@ class includeTree(object):
         for node in self.children:
             node.printChildrenFilePaths(level + 1)
 
-    def __init__(self, topFile, includeDirs, includeMacros=([])):
+    def __init__(self, topFile, includeDirs, includeMacros=([]), parsedFiles=None):
         self.file = os.path.realpath(topFile)
         self.includeDirs = includeDirs
         self.children = []
+        try:
+            self.size = os.path.getsize(self.file)
+        except OSError:
+            self.size = None
+
+        # Nodes of files parsed so far, shared by the whole tree
+        self.parsedFiles = {} if parsedFiles is None else parsedFiles
+        self.parsedFiles[self.file] = self
+
+        self.parsing = True
         self.findIncludedFiles(includeDirs, includeMacros)
+        self.parsing = False
+
+
+class includeTreeItem(object):
+
+    # Place of an included file in the tree, children are created when first needed
+    def __init__(self, node, parent, row):
+        self.node = node
+        self.parent = parent
+        self.row = row
+        self._children = None
+
+    def children(self):
+        if self._children is None:
+            self._children = [includeTreeItem(node, self, row) for row, node in enumerate(self.node.shownChildren())]
+        return self._children
+
+    def createdChildren(self):
+        return self._children or []
+
+
+class IncludeTreeModel(QtCore.QAbstractItemModel):
+
+    HEADERS = ['File', 'Size', 'Lines']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rootItems = []
+        self.fileRows = {}
+        # Unknown until DTS file is loaded
+        self.lineCounts = None
+
+    def setIncludeTree(self, dtsIncludeTree):
+        self.beginResetModel()
+        self.rootItems = []
+        self.fileRows = {}
+        self.lineCounts = None
+        if dtsIncludeTree is not None and not dtsIncludeTree.isHeader():
+            self.rootItems.append(includeTreeItem(dtsIncludeTree, None, 0))
+            self.indexFiles(dtsIncludeTree, (0,))
+        self.endResetModel()
+
+    def indexFiles(self, node, rows):
+        # Rows leading to the first place of each file in the tree,
+        # a shared node is walked only at its first place
+        if node.file in self.fileRows:
+            return
+        self.fileRows[node.file] = rows
+        for row, child in enumerate(node.shownChildren()):
+            self.indexFiles(child, rows + (row,))
+
+    def clear(self):
+        self.setIncludeTree(None)
+
+    def setLineCounts(self, lineCounts):
+        # Count of DTS lines contributed by each file (real path)
+        self.lineCounts = lineCounts
+        self.updateLineCounts(self.rootItems, QModelIndex())
+
+    def updateLineCounts(self, items, parent):
+        if items:
+            column = self.HEADERS.index('Lines')
+            self.dataChanged.emit(self.index(0, column, parent), self.index(len(items) - 1, column, parent),
+                                  [Qt.ItemDataRole.DisplayRole])
+        for item in items:
+            self.updateLineCounts(item.createdChildren(), self.createIndex(item.row, 0, item))
+
+    def fileIndex(self, filePath):
+        # Index of the first place of the file in the tree
+        index = QModelIndex()
+        for row in self.fileRows.get(filePath, ()):
+            index = self.index(row, 0, index)
+        return index
+
+    def filePath(self, index):
+        return index.internalPointer().node.file if index.isValid() else ''
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.column() > 0 or not 0 <= column < len(self.HEADERS):
+            return QModelIndex()
+        items = parent.internalPointer().children() if parent.isValid() else self.rootItems
+        if not 0 <= row < len(items):
+            return QModelIndex()
+        return self.createIndex(row, column, items[row])
+
+    def parent(self, index):
+        item = index.internalPointer().parent if index.isValid() else None
+        if item is None:
+            return QModelIndex()
+        return self.createIndex(item.row, 0, item)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return len(self.rootItems)
+        return len(parent.internalPointer().children())
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+        if not parent.isValid():
+            return bool(self.rootItems)
+        # Don't create children just to draw the expand indicator
+        return any(not node.isHeader() for node in parent.internalPointer().node.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer().node
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return node.fileName()
+            if column == 1:
+                return '{:,}'.format(node.size) if node.size is not None else ''
+            return str(self.lineCounts.get(node.file, 0)) if self.lineCounts is not None else ''
+        if role == Qt.ItemDataRole.ToolTipRole and column == 0:
+            return node.file
+        if role == Qt.ItemDataRole.TextAlignmentRole and column > 0:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
 
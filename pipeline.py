@@ -0,0 +1,114 @@
+import os
+import threading
+
+from PyQt6 import QtCore
+from PyQt6.QtCore import pyqtSignal
+
+from includetree import includeTree
+from helper import loadConfig, annotateDTS
+from dtssearch import DTSSearchIndex
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+class PipelineSignals(QtCore.QObject):
+
+    # Stage index and its description
+    stageStarted = pyqtSignal(int, str)
+    # Progress of current stage: value, maximum (maximum 0 means unknown)
+    progress = pyqtSignal(int, int)
+    # Include tree of the DTS file (includeTree object)
+    includeTreeReady = pyqtSignal(object)
+    # Count of rows of the line table which are ready to be shown
+    rowsReady = pyqtSignal(int)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class DTSPipeline(QtCore.QRunnable):
+
+    STAGES = ['Loading configuration',
+              'Running cpp and dtc',
+              'Scanning included files',
+              'Loading annotated DTS',
+              'Indexing text']
+
+    # Count of DTS lines handed to the view at once
+    BATCH_LINES = 5000
+
+    def __init__(self, fileName, baseDtsFileName, table):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fileName = fileName
+        self.baseDtsFileName = baseDtsFileName
+        self.table = table
+        self.signals = PipelineSignals()
+        self._cancelEvent = threading.Event()
+
+    def cancel(self):
+        self._cancelEvent.set()
+
+    def isCancelled(self):
+        return self._cancelEvent.is_set()
+
+    def startStage(self, stage):
+        if self.isCancelled():
+            raise PipelineCancelled()
+        self.signals.stageStarted.emit(stage, self.STAGES[stage])
+        self.signals.progress.emit(0, 0)
+
+    def loadTable(self, annotatedFileName):
+        fileSize = max(os.path.getsize(annotatedFileName), 1)
+        table = self.table
+        readSize = 0
+        with open(annotatedFileName) as f:
+            # Read each line in the DTS file
+            for lineNum, line in enumerate(f, 1):
+                table.addLine(lineNum, line)
+                readSize += len(line)
+                if lineNum % self.BATCH_LINES == 0:
+                    if self.isCancelled():
+                        raise PipelineCancelled()
+                    self.signals.rowsReady.emit(len(table))
+                    self.signals.progress.emit(min(readSize, fileSize) * 100 // fileSize, 100)
+        self.signals.rowsReady.emit(len(table))
+
+    def run(self):
+        annotatedTmpDTSFileName = None
+        try:
+            self.startStage(0)
+            if self.baseDtsFileName:
+                incIncludes = loadConfig(self.baseDtsFileName)
+            else:
+                incIncludes = loadConfig(self.fileName)
+
+            # Resolve symlinks in path
+            fileName = os.path.realpath(self.fileName)
+
+            self.startStage(1)
+            annotatedTmpDTSFileName = annotateDTS(fileName, incIncludes)
+
+            self.startStage(2)
+            self.signals.includeTreeReady.emit(includeTree(fileName, incIncludes))
+
+            self.startStage(3)
+            self.loadTable(annotatedTmpDTSFileName)
+
+            self.startStage(4)
+            self.table.searchIndex = DTSSearchIndex(self.table.contents)
+
+            self.signals.finished.emit()
+        except PipelineCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        finally:
+            # Delete temporary file if created
+            if annotatedTmpDTSFileName:
+                try:
+                    os.remove(annotatedTmpDTSFileName)
+                except OSError:
+                    pass